@@ -5,9 +5,65 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
+
+    # SQLite database and connection pool (see app/models/database.py)
+    DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', 'database.db')))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))         # seconds
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "20000"))     # page cache per connection
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))  # prepared statements per connection
+    STATS_CACHE_SECONDS = float(os.getenv("STATS_CACHE_SECONDS", "30"))  # dashboard statistics cache
+    CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))   # case context per chat message
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))     # outbound connections per provider
+    LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
     UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
     MAX_UPLOAD_SIZE = 16 * 1024 * 1024  # 16 MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+    # Resized derivatives of uploads (dashboard / case page thumbnails)
+    THUMBNAIL_FOLDER = os.getenv("THUMBNAIL_FOLDER", os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', 'data', 'thumbs')))
+    MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))   # ~50 MP
+    MIN_IMAGE_DIMENSION = int(os.getenv("MIN_IMAGE_DIMENSION", "64"))
+
+    # Longest side of the working copy face detection runs on (aligned crops
+    # are still cut from the full-resolution photo)
+    DETECTION_MAX_SIDE = int(os.getenv("DETECTION_MAX_SIDE", "1280"))
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
+    # Embedding version new case embeddings and scan probes are produced with
+    # (see EMBEDDING_VERSIONS in face_recognition_service)
+    EMBEDDING_VERSION = os.getenv("EMBEDDING_VERSION", "arcface-v1")
+
+    # Face gallery index: "brute" (exact) or "ivf" (approximate, for very large galleries)
+    FACE_INDEX = os.getenv("FACE_INDEX", "brute")
+    FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', 'data', 'face_index.npz')))
+    ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))           # 0 = auto (~4*sqrt(N))
+    ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))         # cells scanned per query
+    ANN_RERANK = int(os.getenv("ANN_RERANK", "4"))         # shortlist = k * rerank
+    ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "2048"))
+
+    # Inference pool for DeepFace work: "thread" workers share one model,
+    # "process" workers each load their own
+    INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+    INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))
+
+    # Micro-batching of the ArcFace embedding stage across concurrent requests
+    EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "10"))
+    EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "16"))
+
+    # Background embedding jobs for newly reported cases
+    EMBEDDING_JOB_CONCURRENCY = int(os.getenv("EMBEDDING_JOB_CONCURRENCY", "2"))
+    EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "5"))
+    EMBEDDING_RETRY_BASE_SECONDS = float(os.getenv("EMBEDDING_RETRY_BASE_SECONDS", "30"))
+    EMBEDDING_JOB_LEASE_SECONDS = float(os.getenv("EMBEDDING_JOB_LEASE_SECONDS", "300"))
+    # How often the running app picks up embeddings rewritten by reembed_cases.py (0 = never)
+    GALLERY_SYNC_SECONDS = float(os.getenv("GALLERY_SYNC_SECONDS", "30"))
+
 config = Config()
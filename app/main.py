@@ -15,12 +15,20 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.models.database import init_db
+from app.models.database import init_db, shutdown_db_executor
 from app.routes.landing import router as landing_router
 from app.routes.report import router as report_router
 from app.routes.officer import router as officer_router
 from app.routes.comments import router as comments_router
 from app.routes.chat import router as chat_router
+from app.routes.media import router as media_router
+from app.routes.cases_api import router as cases_api_router
+from app.services.inference_service import inference
+from app.services.embedding_jobs import embedding_worker
+from app.services.face_gallery import gallery
+from app.services.openai_service import chat_service as openai_chat
+from app.services.gemini_service import chat_service as gemini_chat
+from app.services.upload_store import UploadSizeLimitMiddleware
 from app.config import config
 
 import sys
@@ -36,6 +44,9 @@ app.add_middleware(
     max_age=3600,   # 1 hour
 )
 
+# ── Upload size cap (rejects oversized report bodies before they are parsed) ──
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/report",))
+
 # ── Static files ──────────────────────────────────────────────────────────────
 static_dir = os.path.join(os.path.dirname(__file__), 'static')
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
@@ -50,6 +61,22 @@ app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
 async def startup():
     os.makedirs(config.UPLOAD_FOLDER, exist_ok=True)
     init_db()
+    inference.start()
+    embedding_worker.start()
+    openai_chat.http.start()
+    gemini_chat.http.start()
+    gallery.start_sync(config.GALLERY_SYNC_SECONDS)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await embedding_worker.stop()
+    await gallery.stop_sync()
+    gallery.save_index()
+    inference.shutdown()
+    await openai_chat.http.aclose()
+    await gemini_chat.http.aclose()
+    shutdown_db_executor()
 
 # ── Routers ───────────────────────────────────────────────────────────────────
 app.include_router(landing_router)
@@ -57,3 +84,5 @@ app.include_router(report_router)
 app.include_router(officer_router)
 app.include_router(comments_router)
 app.include_router(chat_router)
+app.include_router(media_router)
+app.include_router(cases_api_router)
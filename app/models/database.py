@@ -1,13 +1,215 @@
 import sqlite3
 import os
+import sys
+import json
+import math
+import time
+import asyncio
+import functools
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'database.db'))
+from app.config import config
+
+# The one database path every module (and script) uses
+DB_PATH = config.DATABASE_PATH
+
+# Online migrations convert rows in small batches so the app keeps serving
+MIGRATION_BATCH_SIZE = 200
+MIGRATION_BATCH_PAUSE = 0.05   # seconds between batches (lets writers in)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Connection pool
+#
+# Opening a connection and applying pragmas on every request is wasted work,
+# and with the default rollback journal a writer blocks every reader. Pooled
+# connections run in WAL mode (readers and one writer proceed concurrently),
+# keep their prepared-statement cache warm between borrowers, and wait on
+# busy locks instead of failing. Callers keep the usual pattern —
+# `conn = get_connection() ... conn.close()` — where close() hands the
+# connection back to the pool.
+# ─────────────────────────────────────────────────────────────────────────────
+
+class PooledConnection:
+    """
+    A borrowed sqlite3 connection; `close()` returns it to the pool.
+    Any transaction left open is rolled back first.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ("_pool", "_conn"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same semantics as sqlite3.Connection: commit or roll back, don't close
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # A connection dropped without close() still goes back to the pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = 8, timeout: float = 5.0):
+        self.path = path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,                    # busy_timeout for locked writes
+            check_same_thread=False,                 # borrowed by one thread at a time
+            cached_statements=config.DB_STATEMENT_CACHE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # durable at checkpoints; safe with WAL
+        conn.execute(f"PRAGMA cache_size = -{int(config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _check_fork(self):
+        # Connections must not cross a fork (e.g. reembed_cases.py worker processes)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle, self._created = [], 0
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._check_fork()
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"database connection pool exhausted ({self.size} in use)")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._created += 1
+                conn = None
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self._created -= 1
+                conn.close()
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        # DB_PATH may be repointed (scripts, tests); start a fresh pool for it
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_PATH, size=config.DB_POOL_SIZE, timeout=config.DB_BUSY_TIMEOUT)
+        return _pool
 
 
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().acquire()
+
+
+# ── Async access ──────────────────────────────────────────────────────────────
+#
+# sqlite3 calls block, so async code must not run them on the event loop: a
+# slow query or a writer waiting on a lock would stall every other request.
+# `run_db` runs a blocking data-access function on a dedicated executor no
+# larger than the connection pool, so DB work queues there instead of on the
+# loop and never holds more threads than there are connections.
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def _get_db_executor():
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=max(1, config.DB_POOL_SIZE),
+                                              thread_name_prefix="db")
+        return _db_executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Await a blocking data-access call (anything using get_connection) off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    global _db_executor
+    with _db_executor_lock:
+        executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
 
 
 def init_db():
@@ -30,8 +232,11 @@ def init_db():
             description TEXT,
 
             -- Image
+            -- embedding: little-endian float32 BLOB (L2-normalised), '' when missing.
+            -- Older databases declare this column TEXT and may still hold JSON text
+            -- until the 001_embedding_blob migration has converted them.
             image_path TEXT NOT NULL,
-            embedding TEXT NOT NULL,
+            embedding BLOB NOT NULL,
 
             -- Complainant Details
             complainant_name TEXT NOT NULL,
@@ -53,7 +258,460 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(case_id) REFERENCES cases(id)
         );
+
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
     """)
 
     conn.commit()
+
+    cursor.execute("SELECT name FROM schema_migrations")
+    applied = {row["name"] for row in cursor.fetchall()}
     conn.close()
+
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+
+    # Schema changes the code depends on are applied before serving starts;
+    # if one fails, startup fails rather than serving a half-migrated schema
+    run_migrations([m for m in pending if not m[2]])
+
+    online = [m for m in pending if m[2]]
+    if online:
+        # Data rewrites: readers understand both old and new formats, so
+        # these run in the background while the app starts serving requests.
+        threading.Thread(
+            target=_run_online_migrations, args=(online,), name="db-migrations", daemon=True
+        ).start()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Embedding encoding
+# ─────────────────────────────────────────────────────────────────────────────
+
+def pack_embedding(embedding) -> bytes:
+    """
+    Encode an embedding as an L2-normalised little-endian float32 BLOB.
+    """
+    values = [float(v) for v in embedding]
+    norm = math.sqrt(sum(v * v for v in values))
+    if norm == 0 or not math.isfinite(norm):
+        raise ValueError("Embedding has zero or invalid norm")
+    packed = array("f", (v / norm for v in values))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_embedding(value) -> list:
+    """
+    Decode a stored embedding (float32 BLOB or legacy JSON text) to a list of floats.
+    Returns an empty list when the case has no embedding.
+    """
+    if not value:
+        return []
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        unpacked = array("f")
+        unpacked.frombytes(bytes(value))
+        if sys.byteorder != "little":
+            unpacked.byteswap()
+        return unpacked.tolist()
+    return json.loads(value)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Migrations
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _migrate_embedding_blob(conn):
+    """
+    Rewrite legacy JSON-text embeddings as normalised float32 BLOBs, in batches.
+    """
+    converted = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, embedding FROM cases "
+            "WHERE typeof(embedding) = 'text' AND embedding != '' LIMIT ?",
+            (MIGRATION_BATCH_SIZE,),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            try:
+                blob = pack_embedding(json.loads(row["embedding"]))
+            except (ValueError, TypeError):
+                blob = ""   # unreadable embedding: clear it so the case gets re-embedded
+            # Guard on the old value so a concurrent writer's update is never overwritten
+            updates.append((blob, row["id"], row["embedding"]))
+
+        cursor.executemany("UPDATE cases SET embedding = ? WHERE id = ? AND embedding = ?", updates)
+        conn.commit()
+        converted += len(updates)
+        time.sleep(MIGRATION_BATCH_PAUSE)
+
+    print(f"[DB] Converted {converted} embedding(s) to binary format.")
+
+
+def _add_column(conn, table: str, column: str, declaration: str):
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row["name"] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _migrate_embedding_jobs(conn):
+    """
+    Track embedding state per case and add the durable embedding job queue.
+    Cases that never got an embedding are queued for another attempt.
+    """
+    _add_column(conn, "cases", "embedding_status", "TEXT DEFAULT 'pending'")
+    _add_column(conn, "cases", "embedding_error", "TEXT")
+    cursor = conn.cursor()
+    cursor.executescript("""
+        CREATE TABLE IF NOT EXISTS embedding_jobs (
+            case_id INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL,            -- unix time; NULL = parked (failed)
+            locked_until REAL,               -- claim held by a worker until then
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(case_id) REFERENCES cases(id)
+        );
+    """)
+    cursor.execute(
+        "UPDATE cases SET embedding_status = "
+        "CASE WHEN embedding != '' THEN 'done' ELSE 'pending' END"
+    )
+    cursor.execute(
+        "INSERT OR IGNORE INTO embedding_jobs (case_id, next_attempt_at) "
+        "SELECT id, ? FROM cases WHERE embedding_status = 'pending'",
+        (time.time(),),
+    )
+    conn.commit()
+
+
+def _migrate_embedding_version(conn):
+    """
+    Tag every embedding with the version (model space) and pipeline
+    (detectors / alignment) that produced it. Everything stored so far came
+    from ArcFace through DeepFace.represent, whose preprocessing embed_faces
+    reproduces (test_embedding_parity.py), so it shares the arcface-v1
+    space. The pipeline that produced it is unknown and left NULL, which
+    makes `reembed_cases.py --only-stale` regenerate it.
+    """
+    _add_column(conn, "cases", "embedding_version", "TEXT")
+    _add_column(conn, "cases", "embedding_pipeline", "TEXT")
+    conn.execute(
+        "UPDATE cases SET embedding_version = 'arcface-v1' "
+        "WHERE embedding != '' AND embedding_version IS NULL"
+    )
+    conn.commit()
+
+
+def _migrate_upload_hashes(conn):
+    """
+    Content hash per case photo and the embedding cache keyed by
+    (image hash, model version).
+    """
+    _add_column(conn, "cases", "image_hash", "TEXT")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            image_hash TEXT NOT NULL,
+            model_version TEXT NOT NULL,     -- embedding version / detector pipeline
+            embedding BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (image_hash, model_version)
+        );
+    """)
+    conn.commit()
+
+
+def _backfill_upload_hashes(conn):
+    """
+    Hash the photos of cases stored before content addressing (the files
+    stay where they are) and seed the embedding cache from their embeddings.
+    """
+    from app.services.upload_store import hash_file, upload_path
+
+    hashed = 0
+    last_id = 0
+    while True:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, image_path FROM cases WHERE image_hash IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_BATCH_SIZE),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        updates = []
+        for row in rows:
+            path = upload_path(row["image_path"])
+            if os.path.exists(path):
+                updates.append((hash_file(path), row["id"]))
+        cursor.executemany("UPDATE cases SET image_hash = ? WHERE id = ?", updates)
+        conn.commit()
+        hashed += len(updates)
+        time.sleep(MIGRATION_BATCH_PAUSE)
+
+    # Only embeddings with a known pipeline can be reused
+    conn.execute("""
+        INSERT OR IGNORE INTO embedding_cache (image_hash, model_version, embedding)
+        SELECT image_hash, embedding_version || '/' || embedding_pipeline, embedding
+        FROM cases
+        WHERE image_hash IS NOT NULL AND embedding != '' AND typeof(embedding) = 'blob'
+          AND embedding_version IS NOT NULL AND embedding_pipeline IS NOT NULL
+    """)
+    conn.commit()
+    print(f"[DB] Hashed {hashed} case photo(s).")
+
+
+def _migrate_hot_query_indexes(conn):
+    """
+    Secondary indexes for the queries that run on every dashboard load,
+    gallery load and queue poll (test_query_plans.py keeps them honest).
+    """
+    conn.executescript("""
+        -- newest-first case listing: ORDER BY created_at DESC LIMIT ?
+        CREATE INDEX IF NOT EXISTS idx_cases_created_at ON cases(created_at);
+        -- get_case_stats_by_date: GROUP BY missing_date (covering)
+        CREATE INDEX IF NOT EXISTS idx_cases_missing_date ON cases(missing_date);
+        -- face gallery load: embedding_version = ? / IS NOT NULL
+        CREATE INDEX IF NOT EXISTS idx_cases_embedding_version ON cases(embedding_version);
+        -- embedding queue stats: GROUP BY embedding_status (covering)
+        CREATE INDEX IF NOT EXISTS idx_cases_embedding_status ON cases(embedding_status);
+        -- a case's comment thread, oldest first
+        CREATE INDEX IF NOT EXISTS idx_comments_case_id ON comments(case_id, created_at);
+        -- embedding worker claim: due jobs ordered by next_attempt_at
+        CREATE INDEX IF NOT EXISTS idx_embedding_jobs_due ON embedding_jobs(next_attempt_at);
+    """)
+    conn.commit()
+
+
+# Time buckets case_stats is kept at, as SQL over a cases row ("{row}" = NEW / OLD / cases)
+STATS_GRAINS = {
+    "day": "COALESCE(trim({row}.missing_date), '')",
+    "week": "COALESCE(date({row}.missing_date, '-6 days', 'weekday 1'), '')",   # Monday
+    "month": "COALESCE(strftime('%Y-%m', {row}.missing_date), '')",
+}
+
+
+def _stats_delta(row: str, delta: int) -> str:
+    statements = []
+    for grain, bucket in STATS_GRAINS.items():
+        statements.append(f"""
+            INSERT INTO case_stats (grain, bucket, status, state, count)
+            VALUES ('{grain}', {bucket.format(row=row)},
+                    COALESCE({row}.status, ''), COALESCE({row}.missing_state, ''), {delta})
+            ON CONFLICT(grain, bucket, status, state) DO UPDATE SET count = count + ({delta});""")
+    if delta < 0:
+        statements.append("\n            DELETE FROM case_stats WHERE count <= 0;")
+    return "".join(statements)
+
+
+def _migrate_case_stats(conn):
+    """
+    Materialised case counts per (day | week | month, status, state), kept
+    current by triggers on every insert, delete and status / date / state
+    change, so dashboard statistics never scan the cases table.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS case_stats (
+            grain TEXT NOT NULL,             -- 'day' | 'week' | 'month'
+            bucket TEXT NOT NULL,            -- YYYY-MM-DD (week: its Monday) | YYYY-MM; '' = no date
+            status TEXT NOT NULL,
+            state TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (grain, bucket, status, state)
+        )
+    """)
+    conn.execute("DELETE FROM case_stats")
+    for grain, bucket in STATS_GRAINS.items():
+        bucket = bucket.format(row="cases")
+        conn.execute(f"""
+            INSERT INTO case_stats (grain, bucket, status, state, count)
+            SELECT '{grain}', {bucket}, COALESCE(status, ''), COALESCE(missing_state, ''), COUNT(*)
+            FROM cases GROUP BY 2, 3, 4
+        """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_case_stats_insert AFTER INSERT ON cases
+        BEGIN{_stats_delta("NEW", 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_case_stats_delete AFTER DELETE ON cases
+        BEGIN{_stats_delta("OLD", -1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_case_stats_update
+        AFTER UPDATE OF missing_date, status, missing_state ON cases
+        WHEN OLD.missing_date IS NOT NEW.missing_date
+          OR OLD.status IS NOT NEW.status
+          OR OLD.missing_state IS NOT NEW.missing_state
+        BEGIN{_stats_delta("OLD", -1)}{_stats_delta("NEW", 1)}
+        END
+    """)
+    conn.commit()
+
+
+def _migrate_case_listing_indexes(conn):
+    """
+    Indexes for the filtered, keyset-paginated case listing: each filter
+    column paired with the (created_at, id) sort order.
+    """
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_cases_status_created ON cases(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_cases_state_created ON cases(missing_state, created_at);
+    """)
+    conn.commit()
+
+
+def _migrate_chat_lookup_indexes(conn):
+    """
+    Case-insensitive indexes for the chat assistant's case lookups by
+    city, state and name prefix.
+    """
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_cases_city_nocase ON cases(missing_city COLLATE NOCASE, created_at);
+        CREATE INDEX IF NOT EXISTS idx_cases_state_nocase ON cases(missing_state COLLATE NOCASE, created_at);
+        CREATE INDEX IF NOT EXISTS idx_cases_name_nocase ON cases(missing_full_name COLLATE NOCASE);
+    """)
+    conn.commit()
+
+
+# Full-text search document for one case: its comments concatenated into one column
+CASE_SEARCH_COMMENTS = "(SELECT group_concat(message, ' ') FROM comments WHERE case_id = {case_id})"
+
+
+def _migrate_case_search(conn):
+    """
+    FTS5 index over case names, places, descriptions and comment text
+    (rowid = case id), kept in sync with `cases` and `comments` by triggers.
+    It supersedes the name-prefix index the chat lookups used.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS case_search USING fts5(
+            name, city, state, description, comments,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    # Term list, used to expand misspelt words into indexed ones
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS case_search_terms USING fts5vocab(case_search, 'row')")
+    conn.execute("DELETE FROM case_search")
+    conn.execute(f"""
+        INSERT INTO case_search (rowid, name, city, state, description, comments)
+        SELECT id, missing_full_name, missing_city, missing_state, description,
+               {CASE_SEARCH_COMMENTS.format(case_id="cases.id")}
+        FROM cases
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_case_search_insert AFTER INSERT ON cases
+        BEGIN
+            INSERT INTO case_search (rowid, name, city, state, description, comments)
+            VALUES (NEW.id, NEW.missing_full_name, NEW.missing_city, NEW.missing_state, NEW.description, NULL);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_case_search_update
+        AFTER UPDATE OF missing_full_name, missing_city, missing_state, description ON cases
+        BEGIN
+            UPDATE case_search SET name = NEW.missing_full_name, city = NEW.missing_city,
+                                   state = NEW.missing_state, description = NEW.description
+            WHERE rowid = NEW.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_case_search_delete AFTER DELETE ON cases
+        BEGIN
+            DELETE FROM case_search WHERE rowid = OLD.id;
+        END
+    """)
+    for event, row in (("INSERT", "NEW"), ("UPDATE OF message, case_id", "NEW"), ("DELETE", "OLD")):
+        name = event.split()[0].lower()
+        refresh = f"""
+            UPDATE case_search SET comments = {CASE_SEARCH_COMMENTS.format(case_id=f"{row}.case_id")}
+            WHERE rowid = {row}.case_id;"""
+        if name == "update":
+            # A comment moved to another case: refresh the old one as well
+            refresh += f"""
+            UPDATE case_search SET comments = {CASE_SEARCH_COMMENTS.format(case_id="OLD.case_id")}
+            WHERE rowid = OLD.case_id AND OLD.case_id IS NOT NEW.case_id;"""
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_comment_search_{name} AFTER {event} ON comments
+            BEGIN{refresh}
+            END
+        """)
+    conn.execute("DROP INDEX IF EXISTS idx_cases_name_nocase")
+    conn.commit()
+
+
+def _migrate_portable_image_paths(conn):
+    """
+    Stored upload paths use "/" on every OS (they double as URL paths);
+    rewrite any saved with Windows separators.
+    """
+    conn.execute("UPDATE cases SET image_path = replace(image_path, '\\', '/') WHERE instr(image_path, '\\') > 0")
+    conn.commit()
+
+
+# (name, function, online) — applied in order, each recorded in schema_migrations
+# once done. Offline migrations run inside init_db before the app serves;
+# online ones are batched data rewrites that run in a background thread.
+MIGRATIONS = [
+    ("001_embedding_blob", _migrate_embedding_blob, True),
+    ("002_embedding_jobs", _migrate_embedding_jobs, False),
+    ("003_embedding_version", _migrate_embedding_version, False),
+    ("004_upload_hashes", _migrate_upload_hashes, False),
+    ("005_backfill_upload_hashes", _backfill_upload_hashes, True),
+    ("006_hot_query_indexes", _migrate_hot_query_indexes, False),
+    ("007_case_stats", _migrate_case_stats, False),
+    ("008_case_listing_indexes", _migrate_case_listing_indexes, False),
+    ("009_chat_lookup_indexes", _migrate_chat_lookup_indexes, False),
+    ("010_case_search", _migrate_case_search, False),
+    ("011_portable_image_paths", _migrate_portable_image_paths, False),
+]
+
+
+def run_migrations(pending=None):
+    """
+    Apply every migration that has not been recorded yet. A failing
+    migration is rolled back, left unrecorded and re-raised.
+    """
+    pending = MIGRATIONS if pending is None else pending
+    conn = get_connection()
+    try:
+        for name, migrate, _online in pending:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE name = ?", (name,))
+            if cursor.fetchone():
+                continue
+            print(f"[DB] Applying migration {name} ...")
+            try:
+                migrate(conn)
+                cursor.execute("INSERT OR IGNORE INTO schema_migrations (name) VALUES (?)", (name,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+
+def _run_online_migrations(pending):
+    # Background thread: a failure must not take the app down. The failed
+    # migration stays unrecorded, so it is retried on the next start.
+    try:
+        run_migrations(pending)
+    except Exception as e:
+        print(f"[DB] Online migration failed, will retry on next start: {e}")
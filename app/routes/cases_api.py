@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Request
+
+from app.routes.officer import is_logged_in
+from app.services.case_service import list_cases_async, CASE_PAGE_SIZE
+from app.services.search_service import search_cases_async, SEARCH_LIMIT
+
+router = APIRouter()
+
+
+@router.get("/api/cases/search")
+async def search_cases_api(request: Request, q: str = "", limit: int = SEARCH_LIMIT, status: str = None):
+    """
+    Ranked full-text search over case names, places, descriptions and
+    comments. Words match as prefixes, with typo-tolerant fallback.
+    """
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+    results = await search_cases_async(q, limit, status or None)
+    return {"query": q, "results": results}
+
+
+@router.get("/api/cases")
+async def cases_api(request: Request, limit: int = CASE_PAGE_SIZE, cursor: str = None,
+                    status: str = None, state: str = None,
+                    date_from: str = None, date_to: str = None):
+    """
+    Newest-first case listing for the officer dashboard. Pass `next_cursor`
+    from the previous response as `cursor` to get the following page.
+    """
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+    try:
+        cases, next_cursor = await list_cases_async(limit, cursor, status or None, state or None,
+                                                    date_from or None, date_to or None)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"cases": cases, "next_cursor": next_cursor}
@@ -6,11 +6,13 @@ import os
 router = APIRouter()
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), '..', 'templates'))
 
-from app.services.case_service import get_case_by_id
+from app.services.case_service import get_case_by_id_async
+from app.services.comment_service import get_case_comments_async
 
 @router.get("/case/{case_id}/comments", response_class=HTMLResponse)
 async def case_comments(request: Request, case_id: int):
-    case = get_case_by_id(case_id)
+    case = await get_case_by_id_async(case_id)
     if not case:
         return RedirectResponse("/") # or show 404
-    return templates.TemplateResponse("case_detail.html", {"request": request, "case": case})
+    comments = await get_case_comments_async(case_id)
+    return templates.TemplateResponse(request, "case_detail.html", {"request": request, "case": case, "comments": comments})
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse, Response
+
+from app.services.thumbnails import thumbnails, THUMB_FORMATS
+
+router = APIRouter()
+
+# Derivatives are immutable for a given URL (the source is content-addressed)
+THUMB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _pick_format(request: Request, fmt: str = None) -> str:
+    if fmt in THUMB_FORMATS:
+        return fmt
+    return "webp" if "image/webp" in request.headers.get("accept", "") else "jpg"
+
+
+# Plain `def`: first-time rendering is CPU work, so FastAPI runs it in the threadpool
+@router.get("/thumbs/{size}/{image_path:path}")
+def thumbnail(request: Request, size: str, image_path: str, fmt: str = None):
+    fmt = _pick_format(request, fmt)
+    try:
+        path, etag = thumbnails.get(image_path, size, fmt)
+    except (FileNotFoundError, KeyError):
+        return Response(status_code=404)
+    except ValueError as e:
+        print(f"[Thumbnails] {e}")
+        return Response(status_code=404)
+
+    headers = {"ETag": etag, "Cache-Control": THUMB_CACHE_CONTROL, "Vary": "Accept"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=THUMB_FORMATS[fmt][1], headers=headers)
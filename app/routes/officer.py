@@ -2,16 +2,23 @@ import os
 import sys
 import base64
 import json
+import time
+import asyncio
 import numpy as np
-import cv2
 
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, Request, Form, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from app.models.database import get_connection
+from app.models.database import get_connection, run_db
+from app.services.face_gallery import gallery
+from app.services.face_recognition_service import detect_faces_normalized, batcher, FaceTracker, match_threshold
+from app.services.image_prep import decode_image
+from app.services.inference_service import inference
+from app.services.embedding_jobs import embedding_worker
+from app.services.stats_service import case_stats, pick_grain
 
 templates = Jinja2Templates(
     directory=os.path.join(os.path.dirname(__file__), '..', 'templates')
@@ -66,31 +73,20 @@ async def officer_logout(request: Request):
     return RedirectResponse("/officer-login", status_code=302)
 
 
-from app.services.case_service import get_recent_cases, get_case_stats_by_date
+from app.services.case_service import list_cases_async, get_case_stats_by_date_async
 
 @router.get("/officer-dashboard", response_class=HTMLResponse)
 async def officer_dashboard(request: Request):
     if not is_logged_in(request):
         return RedirectResponse("/officer-login", status_code=302)
     
-    cases = get_recent_cases(limit=50)
-    stats = get_case_stats_by_date()
-    
-    # EXHAUSTIVE DEBUG LOGGING
-    import os
-    from app.models.database import DB_PATH
-    from app.config import config
-    print(f"\n[DASHBOARD ACCESS] {request.client.host}")
-    print(f"  CWD: {os.getcwd()}")
-    print(f"  DB_PATH: {DB_PATH}")
-    print(f"  DB Size: {os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 'N/A'}")
-    print(f"  Upload Folder: {config.UPLOAD_FOLDER}")
-    from app.services.case_service import debug_to_file
-    debug_to_file(f"Dashboard stats requested. Count={len(cases)}, Stats={stats}")
-    
-    return templates.TemplateResponse("officer_dashboard.html", {
+    # First page is inlined; the rest is fetched from /api/cases on scroll
+    cases, next_cursor = await list_cases_async()
+    stats = await get_case_stats_by_date_async()
+
+    return templates.TemplateResponse(request, "officer_dashboard.html", {
         "request": request, 
-        "cases": cases,
+        "first_page": {"cases": cases, "next_cursor": next_cursor},
         "stats": stats
     })
 
@@ -99,6 +95,196 @@ async def officer_dashboard(request: Request):
 # DeepFace scan-frame API
 # ─────────────────────────────────────────────────────────────────────────────
 
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 100
+
+# Options a live-scan session accepts from the client's JSON text messages
+SCAN_OPTION_KEYS = {"mode", "top_k", "max_distance"}
+
+
+def _parse_match_limits(params) -> tuple:
+    """
+    Read the `top_k` / `max_distance` request contract (clamped to sane bounds).
+    """
+    try:
+        top_k = int(params.get("top_k", DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        top_k = DEFAULT_TOP_K
+    top_k = max(1, min(top_k, MAX_TOP_K))
+
+    max_distance = params.get("max_distance")
+    try:
+        max_distance = float(max_distance) if max_distance is not None else None
+    except (TypeError, ValueError):
+        max_distance = None
+    return top_k, max_distance
+
+
+def _result_rows(case_ids, distances, version: str) -> list:
+    rows = []
+    threshold = match_threshold(version)
+    for case_id, dist in zip(case_ids.tolist(), distances.tolist()):
+        meta = gallery.meta(case_id)
+        rows.append({
+            "case_id":  case_id,
+            "name":     meta.get("name"),
+            "distance": round(dist, 4),
+            "matched":  dist <= threshold,
+            "version":  version,
+            "complainant_phone": meta.get("complainant_phone"),
+        })
+    return rows
+
+
+async def _match_faces(crops: list, top_k: int, max_distance: float) -> tuple:
+    """
+    Match aligned face crops against every embedding version in the gallery.
+
+    Each crop is embedded once per version (normally just the active one;
+    two during a model migration) and searched only in that version's
+    gallery. Per crop the rows are merged, ranked by distance relative to
+    each version's threshold. Returns (rows per crop, active-version probes).
+    """
+    await gallery.ensure_loaded_async()
+    versions = gallery.versions()
+    # Each embed_many gives up after the inference timeout, like inference.run
+    embedded = await asyncio.gather(*(batcher.embed_many(crops, v) for v in versions))
+
+    rows = [[] for _ in crops]
+    active = None
+    for version, probes in zip(versions, embedded):
+        probes = np.vstack(probes)
+        active = probes if active is None else active
+        matches = gallery.search_many(probes, top_k=top_k, max_distance=max_distance, version=version)
+        for face_rows, (case_ids, distances) in zip(rows, matches):
+            face_rows.extend(_result_rows(case_ids, distances, version))
+
+    if len(versions) > 1:
+        rank = lambda r: r["distance"] / match_threshold(r["version"])
+        rows = [sorted(face_rows, key=rank)[:top_k] for face_rows in rows]
+    return rows, active
+
+
+def _send_alert(top: dict, alerted: set = None):
+    # Auto-send WhatsApp alert for a confident match (once per case in `alerted`)
+    if not (top["matched"] and top.get("complainant_phone")):
+        return
+    if alerted is not None:
+        if top["case_id"] in alerted:
+            return
+        alerted.add(top["case_id"])
+    try:
+        from app.services.whatsapp_service import send_match_alert
+        send_match_alert(
+            complainant_phone=top["complainant_phone"],
+            missing_name=top["name"],
+            match_distance=top["distance"],
+            case_id=top["case_id"],
+        )
+    except Exception:
+        pass  # don't fail the scan if WhatsApp errors
+
+
+async def _scan_single(frame, top_k: int, max_distance: float, alerted: set = None) -> dict:
+    # Detect on the inference pool, then embed through the micro-batcher
+    faces = await inference.run(detect_faces_normalized, frame, "opencv")
+
+    # Only the best `top_k` candidates are materialised and returned
+    (results,), _ = await _match_faces([faces[0]["face"]], top_k, max_distance)
+
+    if results:
+        _send_alert(results[0], alerted)
+    return {"results": results}
+
+
+async def _scan_multi(frame, top_k: int, max_distance: float, alerted: set = None) -> dict:
+    # One detector pass for every face, one batched embed, one matrix-matrix match
+    faces = await inference.run(detect_faces_normalized, frame, "opencv")
+    matches, _ = await _match_faces([f["face"] for f in faces], top_k, max_distance)
+
+    alerted = set() if alerted is None else alerted   # one alert per case per frame
+    out = []
+    for face, results in zip(faces, matches):
+        area = face["facial_area"]
+        if results:
+            _send_alert(results[0], alerted)
+        out.append({
+            "box": {k: int(area[k]) for k in ("x", "y", "w", "h")},
+            "confidence": round(float(face.get("confidence") or 0), 3),
+            "results": results,
+        })
+    return {"faces": out}
+
+
+async def _scan_tracked(frame, tracker: FaceTracker, params, alerted: set = None) -> dict:
+    """
+    Continuous-scan pipeline: detection runs every frame, but only faces
+    whose track needs it (new / better quality / refresh due) are embedded
+    and matched; the rest reuse the cached result for their track.
+    """
+    top_k, max_distance = _parse_match_limits(params)
+    multi = params.get("mode") == "multi"
+
+    # No enforcement: an empty frame must still age the tracks out. DeepFace
+    # reports "no face" as one whole-frame region with zero confidence.
+    faces = await inference.run(detect_faces_normalized, frame, "opencv", False)
+    faces = [f for f in faces if (f.get("confidence") or 0) > 0]
+    if not multi:
+        faces = faces[:1]
+
+    tracked = tracker.update(faces)
+    if not tracked and not multi:
+        return {"error": _scan_error_message(ValueError("Face could not be detected"))}
+    stale = [(track, face) for track, face, needs in tracked if needs]
+    if stale:
+        matches, probes = await _match_faces([face["face"] for _, face in stale], top_k, max_distance)
+        for (track, face), probe, results in zip(stale, probes, matches):
+            tracker.record(track, face, probe, results)
+
+    alerted = set() if alerted is None else alerted
+    out = []
+    for track, face, _ in tracked:
+        if track.results:
+            _send_alert(track.results[0], alerted)
+        out.append({
+            "track_id": track.track_id,
+            "box": {k: int(face["facial_area"][k]) for k in ("x", "y", "w", "h")},
+            "confidence": round(float(face.get("confidence") or 0), 3),
+            "results": track.results or [],
+        })
+
+    if multi:
+        return {"faces": out, "embedded": len(stale)}
+    return {
+        "results": out[0]["results"] if out else [],
+        "track_id": out[0]["track_id"] if out else None,
+        "embedded": len(stale),
+    }
+
+
+def _scan_error_message(e: Exception) -> str:
+    err = str(e)
+    if "Face could not be detected" in err or "enforce_detection" in err:
+        return "No face detected — ensure good lighting and face the camera."
+    return err
+
+
+async def _run_scan(frame, params, alerted: set = None) -> dict:
+    """
+    Shared scan pipeline: `params` carries the mode / top_k / max_distance contract.
+    `alerted` (optional) collects case ids already alerted in a scan session.
+    """
+    top_k, max_distance = _parse_match_limits(params)
+
+    await gallery.ensure_loaded_async()
+    if len(gallery) == 0:
+        return {"error": "No registered cases in the database yet."}
+
+    if params.get("mode") == "multi":
+        return await _scan_multi(frame, top_k, max_distance, alerted)
+    return await _scan_single(frame, top_k, max_distance, alerted)
+
+
 @router.post("/officer/scan-frame")
 async def scan_frame(request: Request):
     if not is_logged_in(request):
@@ -110,92 +296,195 @@ async def scan_frame(request: Request):
 
         # Decode base64 → OpenCV BGR frame
         img_bytes = base64.b64decode(frame_b64)
-        np_arr    = np.frombuffer(img_bytes, np.uint8)
-        frame     = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        frame     = decode_image(img_bytes)
 
         if frame is None:
             return {"error": "Could not decode image frame."}
 
-        # Lazy-import DeepFace (TF takes a moment to load)
-        from deepface import DeepFace
+        return await _run_scan(frame, body)
 
-        # Extract probe embedding
-        rep       = DeepFace.represent(
-            img_path=frame,
-            model_name="ArcFace",
-            detector_backend="opencv",
-            align=True,
-            enforce_detection=True,
-        )
-        probe_emb = np.array(rep[0]["embedding"])
-
-        # Load all cases with embeddings from DB
-        conn   = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, missing_full_name, image_path, embedding, "
-            "       complainant_phone FROM cases WHERE embedding != ''"
-        )
-        cases = cursor.fetchall()
-        conn.close()
-
-        if not cases:
-            return {"error": "No registered cases in the database yet."}
-
-        # Compare against every case
-        results = []
-        THRESHOLD = 0.68
-        for case in cases:
-            try:
-                stored_emb = np.array(json.loads(case["embedding"]))
-                # Cosine distance
-                dist = float(1.0 - np.dot(probe_emb, stored_emb) /
-                             (np.linalg.norm(probe_emb) * np.linalg.norm(stored_emb)))
-                results.append({
-                    "case_id":  case["id"],
-                    "name":     case["missing_full_name"],
-                    "distance": round(dist, 4),
-                    "matched":  dist <= THRESHOLD,
-                    "complainant_phone": case["complainant_phone"],
-                })
-            except Exception:
-                continue
-
-        if not results:
-            return {"error": "No valid embeddings found in database."}
-
-        results.sort(key=lambda x: x["distance"])
-
-        # Auto-send WhatsApp alert for first confident match
-        top = results[0]
-        if top["matched"] and top.get("complainant_phone"):
-            try:
-                from app.services.whatsapp_service import send_match_alert
-                send_match_alert(
-                    complainant_phone=top["complainant_phone"],
-                    missing_name=top["name"],
-                    match_distance=top["distance"],
-                    case_id=top["case_id"],
-                )
-            except Exception:
-                pass  # don't fail the scan if WhatsApp errors
-
-        return {"results": results}
+    except Exception as e:
+        return {"error": _scan_error_message(e)}
+
+
+RAW_FRAME_TYPES = ("image/jpeg", "image/webp", "image/png", "application/octet-stream")
+
+
+@router.post("/officer/scan-frame/raw")
+async def scan_frame_raw(request: Request):
+    """
+    Binary variant of scan-frame: the frame is the raw request body
+    (image/jpeg, image/webp, ...) or a multipart `frame` field, and the
+    mode / top_k / max_distance options come from the query string.
+    Avoids the base64 + JSON round trip of /officer/scan-frame.
+    """
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+
+    try:
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("frame")
+            if upload is None or isinstance(upload, str):
+                return {"error": "Missing 'frame' file field."}
+            img_bytes = await upload.read()
+        elif content_type.split(";")[0].strip() in RAW_FRAME_TYPES:
+            img_bytes = await request.body()
+        else:
+            return {"error": f"Unsupported content type: {content_type or 'none'}"}
+
+        # Decoded straight from the request bytes (zero-copy view), EXIF-upright
+        frame = decode_image(img_bytes)
+        if frame is None:
+            return {"error": "Could not decode image frame."}
+
+        return await _run_scan(frame, request.query_params)
 
     except Exception as e:
-        err = str(e)
-        if "Face could not be detected" in err or "enforce_detection" in err:
-            return {"error": "No face detected — ensure good lighting and face the camera."}
-        return {"error": err}
+        return {"error": _scan_error_message(e)}
 
-@router.get("/officer/debug-db")
-async def debug_db(request: Request):
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Live-scan WebSocket session
+# ─────────────────────────────────────────────────────────────────────────────
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox: a new frame overwrites any frame not yet processed
+    (latest-frame-wins), so slow inference never builds up a backlog.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame_bytes: bytes):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame_bytes
+        self._event.set()
+
+    async def take(self) -> bytes:
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+@router.websocket("/officer/scan-ws")
+async def scan_ws(websocket: WebSocket):
+    """
+    Persistent live-scan session. The browser streams binary JPEG frames
+    (and optional JSON text messages to change mode / top_k); the server
+    scans only the newest frame and pushes each result as it is ready.
+    Faces are tracked across frames so a person who stays in view is not
+    re-embedded on every frame.
+    """
+    # Accept first: a close before the handshake completes reaches the
+    # browser as a failed connection (1006), not as the 4401 it handles
+    await websocket.accept()
+    if websocket.session.get("officer") != ADMIN_USERNAME:
+        await websocket.close(code=4401)
+        return
+
+    slot = LatestFrameSlot()
+    options = {"mode": "single", "top_k": DEFAULT_TOP_K}
+    alerted = set()     # WhatsApp once per case for the whole session
+    tracker = FaceTracker()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+            elif message.get("text"):
+                try:
+                    update = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if isinstance(update, dict):
+                    options.update({k: v for k, v in update.items() if k in SCAN_OPTION_KEYS})
+
+    async def process_frames():
+        while True:
+            img_bytes = await slot.take()
+            started = time.perf_counter()
+            frame = decode_image(img_bytes)
+            if frame is None:
+                result = {"error": "Could not decode image frame."}
+            else:
+                try:
+                    await gallery.ensure_loaded_async()
+                    if len(gallery) == 0:
+                        result = {"error": "No registered cases in the database yet."}
+                    else:
+                        result = await _scan_tracked(frame, tracker, options, alerted)
+                except Exception as e:
+                    result = {"error": _scan_error_message(e)}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["dropped_frames"] = slot.dropped
+            result["tracking"] = tracker.stats()
+            await websocket.send_json(result)
+
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    try:
+        await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        receiver.cancel()
+        processor.cancel()
+
+
+@router.get("/officer/inference-stats")
+async def inference_stats(request: Request):
     if not is_logged_in(request):
         return {"error": "Unauthorised"}
-    
+    await gallery.ensure_loaded_async()
+    return {
+        **inference.stats(),
+        "batching": batcher.stats(),
+        "embedding_jobs": await run_db(embedding_worker.stats),
+        "gallery": gallery.stats(),
+    }
+
+
+@router.get("/officer/case-stats")
+async def case_stats_api(request: Request, grain: str = None, start: str = None, end: str = None,
+                         status: str = None, state: str = None):
+    """
+    Case counts per day / week / month for a date range (the grain is chosen
+    from the range length when not given).
+    """
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+    try:
+        grain = grain or pick_grain(start, end)
+        series = await run_db(case_stats.series, grain, start, end, status, state)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"grain": grain, "series": series, "totals": await run_db(case_stats.totals)}
+
+
+@router.post("/officer/case/{case_id}/retry-embedding")
+async def retry_embedding(case_id: int, request: Request):
+    """
+    Re-queue the face embedding for a case whose background job failed.
+    """
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+    if not await run_db(embedding_worker.retry, case_id):
+        return {"error": f"Case {case_id} not found"}
+    return {"status": "pending", "case_id": case_id}
+
+
+def _debug_db_snapshot() -> dict:
     from app.models.database import DB_PATH
-    import sqlite3
-    
+    from app.config import config
+
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) as count FROM cases")
@@ -218,3 +507,10 @@ async def debug_db(request: Request):
         "upload_folder": config.UPLOAD_FOLDER,
         "upload_folder_exists": os.path.exists(config.UPLOAD_FOLDER)
     }
+
+
+@router.get("/officer/debug-db")
+async def debug_db(request: Request):
+    if not is_logged_in(request):
+        return {"error": "Unauthorised"}
+    return await run_db(_debug_db_snapshot)
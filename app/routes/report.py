@@ -2,14 +2,23 @@ from fastapi import APIRouter, Request, Form, UploadFile, File
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 import os
-from app.services.case_service import save_case
+from app.config import config
+from app.services.case_service import save_case_async
+from app.services.upload_store import UploadRejected, read_image_upload
 
 router = APIRouter()
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), '..', 'templates'))
 
+# Errors raised before the form reaches the handler (see UploadSizeLimitMiddleware)
+REPORT_ERRORS = {
+    "too_large": "The upload is too large — photos must be under {mb} MB.",
+}
+
+
 @router.get("/report", response_class=HTMLResponse)
-async def report_get(request: Request):
-    return templates.TemplateResponse("report.html", {"request": request})
+async def report_get(request: Request, error: str = None):
+    message = REPORT_ERRORS.get(error, "").format(mb=config.MAX_UPLOAD_SIZE // (1024 * 1024))
+    return templates.TemplateResponse(request, "report.html", {"request": request, "error": message or None})
 
 @router.post("/report")
 async def report_post(
@@ -45,7 +54,15 @@ async def report_post(
         "address_line1": address_line1
     }
 
-    case_id = save_case(form_data, missing_image)
+    # Validate the photo (size cap, real image type, dimensions) before it is stored
+    try:
+        image_chunks, ext = await read_image_upload(missing_image)
+    except UploadRejected as e:
+        return templates.TemplateResponse(
+            request, "report.html", {"request": request, "error": str(e)}, status_code=400
+        )
+
+    case_id = await save_case_async(form_data, image_chunks, ext)
 
     # Send WhatsApp confirmation to complainant
     try:
@@ -0,0 +1,270 @@
+import os
+import math
+import numpy as np
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Index backends for the face gallery
+#
+# An index only proposes a shortlist of candidate case ids for a probe; the
+# gallery always reranks that shortlist with exact float32 cosine distance.
+# `candidates()` returning None means "no shortlist, score everything".
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class BruteForceIndex:
+    """
+    Exact search: no shortlist, every gallery row is scored.
+    """
+
+    name = "brute"
+    trained = False
+
+    def build(self, ids, matrix):
+        pass
+
+    def add(self, case_id: int, vec):
+        pass
+
+    def remove(self, case_id: int):
+        pass
+
+    def candidates(self, probe, k: int):
+        return None
+
+    def save(self, path: str):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class _InvertedList:
+    """
+    Growable (ids, float16 codes) storage for one IVF cell.
+    """
+
+    def __init__(self, dim: int):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, dim), dtype=np.float16)
+        self.size = 0
+
+    def append(self, case_id: int, code) -> int:
+        if self.size == self.ids.shape[0]:
+            capacity = max(16, self.ids.shape[0] * 2)
+            ids = np.empty(capacity, dtype=np.int64)
+            codes = np.empty((capacity, self.codes.shape[1]), dtype=np.float16)
+            ids[:self.size] = self.ids[:self.size]
+            codes[:self.size] = self.codes[:self.size]
+            self.ids, self.codes = ids, codes
+        pos = self.size
+        self.ids[pos] = case_id
+        self.codes[pos] = code
+        self.size += 1
+        return pos
+
+    def pop(self, pos: int):
+        """
+        Remove the entry at `pos` by swapping in the last one.
+        Returns the case id that moved into `pos` (or None).
+        """
+        last = self.size - 1
+        moved = None
+        if pos != last:
+            moved = int(self.ids[last])
+            self.ids[pos] = self.ids[last]
+            self.codes[pos] = self.codes[last]
+        self.size = last
+        return moved
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-length embeddings.
+
+    A spherical k-means coarse quantizer splits the gallery into `nlist`
+    cells; a query scans only the `nprobe` closest cells using float16
+    codes and returns the best `k * rerank` ids for exact reranking.
+    Raising `nprobe` / `rerank` trades latency for recall.
+    """
+
+    name = "ivf"
+
+    def __init__(self, dim: int, nlist: int = 0, nprobe: int = 8, rerank: int = 4,
+                 min_train: int = 2048, kmeans_iters: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist            # 0 = choose from gallery size at build time
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.min_train = min_train
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = []
+        self._where = {}              # case_id -> (list_no, pos)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # ── Training ──────────────────────────────────────────────────────────────
+
+    def build(self, ids, matrix):
+        """
+        Train the coarse quantizer on `matrix` and index every row.
+        Galleries smaller than `min_train` stay untrained (exact search).
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        n = matrix.shape[0]
+        if n < self.min_train:
+            self.centroids = None
+            self._lists, self._where = [], {}
+            return
+
+        nlist = self.nlist or int(min(4096, max(16, 4 * math.sqrt(n))))
+        self.centroids = self._train_kmeans(matrix, nlist)
+        self.trained_size = n
+        self._lists = [_InvertedList(self.dim) for _ in range(nlist)]
+        self._where = {}
+
+        assignments = self._assign(matrix, self.centroids)
+        for case_id, list_no, vec in zip(ids.tolist(), assignments.tolist(), matrix):
+            pos = self._lists[list_no].append(case_id, vec)
+            self._where[case_id] = (list_no, pos)
+
+    def _train_kmeans(self, matrix, nlist: int):
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(matrix.shape[0], nlist * 32)
+        sample = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            assign = self._assign(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            # Per-cell sums via one sorted pass (much faster than np.add.at)
+            order = np.argsort(assign, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            # Re-seed empty cells from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+        return centroids.astype(np.float32)
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk: int = 8192):
+        out = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk):
+            block = matrix[start:start + chunk]
+            out[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    # ── Incremental updates ───────────────────────────────────────────────────
+
+    def add(self, case_id: int, vec):
+        if not self.trained:
+            return
+        self.remove(case_id)
+        list_no = int(np.argmax(self.centroids @ vec))
+        pos = self._lists[list_no].append(case_id, vec)
+        self._where[case_id] = (list_no, pos)
+
+    def remove(self, case_id: int):
+        loc = self._where.pop(case_id, None)
+        if loc is None:
+            return
+        list_no, pos = loc
+        moved = self._lists[list_no].pop(pos)
+        if moved is not None:
+            self._where[moved] = (list_no, pos)
+
+    # ── Search ────────────────────────────────────────────────────────────────
+
+    def candidates(self, probe, k: int):
+        """
+        Shortlist of case ids likely to be among the `k` nearest to `probe`.
+        """
+        if not self.trained:
+            return None
+
+        nprobe = min(self.nprobe, len(self._lists))
+        coarse = self.centroids @ probe
+        cells = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+        ids, scores = [], []
+        for list_no in cells.tolist():
+            inv = self._lists[list_no]
+            if inv.size:
+                ids.append(inv.ids[:inv.size])
+                # numpy has no BLAS path for float16; upcasting first is ~10x faster
+                scores.append(inv.codes[:inv.size].astype(np.float32) @ probe)
+        if not ids:
+            return np.empty(0, dtype=np.int64)
+
+        ids = np.concatenate(ids)
+        scores = np.concatenate(scores)
+        shortlist = min(ids.shape[0], max(k, 1) * self.rerank)
+        if shortlist < ids.shape[0]:
+            ids = ids[np.argpartition(-scores, shortlist - 1)[:shortlist]]
+        return ids
+
+    # ── Persistence ───────────────────────────────────────────────────────────
+
+    def save(self, path: str):
+        if not self.trained:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        sizes = np.array([inv.size for inv in self._lists], dtype=np.int64)
+        ids = np.concatenate([inv.ids[:inv.size] for inv in self._lists])
+        codes = np.concatenate([inv.codes[:inv.size] for inv in self._lists])
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, sizes=sizes, ids=ids, codes=codes,
+                 trained_size=np.int64(self.trained_size))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Restore a saved index. Returns False if the file is missing or incompatible.
+        """
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            centroids = data["centroids"]
+            if centroids.shape[1] != self.dim:
+                return False
+            sizes, ids, codes = data["sizes"], data["ids"], data["codes"]
+            self.trained_size = int(data["trained_size"])
+
+        self.centroids = centroids.astype(np.float32)
+        self._lists, self._where = [], {}
+        offset = 0
+        for list_no, size in enumerate(sizes.tolist()):
+            inv = _InvertedList(self.dim)
+            inv.ids = ids[offset:offset + size].copy()
+            inv.codes = codes[offset:offset + size].copy()
+            inv.size = size
+            for pos, case_id in enumerate(inv.ids.tolist()):
+                self._where[case_id] = (list_no, pos)
+            self._lists.append(inv)
+            offset += size
+        return True
+
+    def indexed_ids(self) -> set:
+        return set(self._where)
+
+    def __len__(self):
+        return len(self._where)
+
+
+def create_index(kind: str, dim: int, **params):
+    """
+    Index factory used by the gallery (`kind` is "brute" or "ivf").
+    """
+    if kind == "ivf":
+        return IVFIndex(dim, **params)
+    return BruteForceIndex()
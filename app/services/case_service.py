@@ -1,70 +1,117 @@
-import os
 import json
-from app.models.database import get_connection
+import base64
+from app.models.database import get_connection, run_db
 from app.config import config
 
-def save_case(data: dict, image_file):
+# Detector fallback chain for case photos, fastest first. It is recorded per
+# embedding (`embedding_pipeline`), so `reembed_cases.py --only-stale` knows
+# which stored embeddings to regenerate after it changes.
+CASE_DETECTORS = ["opencv", "ssd", "retinaface"]
+
+
+def case_pipeline() -> str:
     """
-    Saves a missing person case to the database, including image and embedding.
+    Identifies the detector / alignment / preprocessing settings that produce
+    case embeddings. "bgr" marks crops preprocessed exactly as
+    DeepFace.represent does; rows embedded before that fix lack it and are
+    treated as stale.
     """
-    import numpy as np
-    import uuid
-    import shutil
-    # 1. Save the image file
-    os.makedirs(config.UPLOAD_FOLDER, exist_ok=True)
-    ext = image_file.filename.split('.')[-1]
-    filename = f"{uuid.uuid4()}.{ext}"
-    image_path = os.path.join(config.UPLOAD_FOLDER, filename)
-    
-    with open(image_path, "wb") as buffer:
-        shutil.copyfileobj(image_file.file, buffer)
+    return f"{'+'.join(CASE_DETECTORS)}/align/exif/bgr"
 
-    # 2. Generate Face Embedding using DeepFace (with detector fallback chain)
-    embedding_json = ""
-    try:
-        from deepface import DeepFace  # lazy import to avoid blocking server startup
-
-        _detectors = ["opencv", "ssd", "retinaface"]
-        _embedding = None
-
-        for _backend in _detectors:
-            try:
-                _res = DeepFace.represent(
-                    img_path=image_path,
-                    model_name="ArcFace",
-                    detector_backend=_backend,
-                    enforce_detection=True,
-                )
-                _embedding = _res[0]["embedding"]
-                break  # stop on first success
-            except Exception:
-                continue
-
-        if _embedding is None:
-            # Last resort: skip enforcement so we still get an embedding
-            _res = DeepFace.represent(
-                img_path=image_path,
-                model_name="ArcFace",
-                detector_backend="opencv",
-                enforce_detection=False,
-            )
-            _embedding = _res[0]["embedding"]
-
-        if _embedding:
-            embedding_json = json.dumps(_embedding)
-    except Exception as e:
-        print(f"Embedding error: {e}")
 
-    # 3. Save to Database
+def embedding_fingerprint() -> str:
+    """
+    Embedding version plus pipeline: everything that determines a stored case embedding.
+    """
+    from app.services.face_recognition_service import EMBEDDING_VERSION
+    return f"{EMBEDDING_VERSION}/{case_pipeline()}"
+
+
+def detect_case_face(image_path: str):
+    """
+    Aligned face crop for a case photo using the detector fallback chain
+    (opencv -> ssd -> retinaface -> enforce_detection=False). The photo is
+    decoded and made upright once; detection runs at working resolution
+    and the crop is taken at full resolution.
+    """
+    from app.services.face_recognition_service import detect_faces_normalized
+    from app.services.image_prep import load_image
+
+    img = load_image(image_path)
+    for _backend in CASE_DETECTORS:
+        try:
+            faces = detect_faces_normalized(img, detector_backend=_backend, enforce_detection=True)
+            return faces[0]["face"]  # stop on first success
+        except Exception:
+            continue
+
+    # Last resort: skip enforcement so we still get an embedding
+    return detect_faces_normalized(img, detector_backend="opencv", enforce_detection=False)[0]["face"]
+
+
+def compute_case_embedding(image_path: str):
+    """
+    Face embedding for a case photo (see `detect_case_face`).
+    Blocking: run it on the inference pool. Raises if no embedding could be made.
+    """
+    from app.services.face_recognition_service import embed_faces
+    return embed_faces([detect_case_face(image_path)])[0].tolist()
+
+
+def get_cached_embedding(cursor, image_hash: str, model_version: str):
+    """
+    Stored embedding BLOB for this exact photo and model version, or None.
+    """
+    if not image_hash:
+        return None
+    cursor.execute(
+        "SELECT embedding FROM embedding_cache WHERE image_hash = ? AND model_version = ?",
+        (image_hash, model_version),
+    )
+    row = cursor.fetchone()
+    return row["embedding"] if row else None
+
+
+def cache_embedding(cursor, image_hash: str, model_version: str, blob: bytes):
+    if image_hash:
+        cursor.execute(
+            "INSERT OR REPLACE INTO embedding_cache (image_hash, model_version, embedding) "
+            "VALUES (?, ?, ?)",
+            (image_hash, model_version, blob),
+        )
+
+
+def save_case(data: dict, image_chunks: list, ext: str):
+    """
+    Saves a missing person case to the database with its image, given as
+    the validated chunks from `read_image_upload`.
+    The photo is stored by content hash. If the same photo was embedded
+    before with the current model version the cached embedding is reused;
+    otherwise the case is stored with embedding_status 'pending' and queued
+    for the background embedding worker.
+    """
+    import time
+    from app.services.embedding_jobs import embedding_worker
+    from app.services.upload_store import store_stream
+    from app.models.database import unpack_embedding
+
+    # 1. Save the image file (hashed while it streams to disk)
+    image_hash, filename = store_stream(image_chunks, ext)
+
+    # 2. Save to Database together with its embedding job
     conn = get_connection()
     cursor = conn.cursor()
+
+    version = config.EMBEDDING_VERSION
+    cached = get_cached_embedding(cursor, image_hash, embedding_fingerprint())
     
     cursor.execute("""
         INSERT INTO cases (
             missing_full_name, gender, age, missing_state, missing_city, 
-            pin_code, missing_date, missing_time, description, image_path, embedding,
+            pin_code, missing_date, missing_time, description, image_path, image_hash,
+            embedding, embedding_version, embedding_pipeline, embedding_status,
             complainant_name, relationship, complainant_phone, address_line1
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         data.get("missing_full_name"),
         data.get("gender"),
@@ -75,8 +122,12 @@ def save_case(data: dict, image_file):
         data.get("missing_date"),
         data.get("missing_time"),
         data.get("description"),
-        filename, # store relative path/filename
-        embedding_json,
+        filename, # store path relative to UPLOAD_FOLDER
+        image_hash,
+        cached or "",
+        version if cached else None,
+        case_pipeline() if cached else None,
+        "done" if cached else "pending",
         data.get("complainant_name"),
         data.get("relationship"),
         data.get("complainant_phone"),
@@ -84,18 +135,100 @@ def save_case(data: dict, image_file):
     ))
     
     case_id = cursor.lastrowid
+    if not cached:
+        cursor.execute(
+            "INSERT INTO embedding_jobs (case_id, next_attempt_at) VALUES (?, ?)",
+            (case_id, time.time()),
+        )
     conn.commit()
     conn.close()
+
+    from app.services.stats_service import case_stats
+    case_stats.invalidate()
+
+    # 3. Publish a memoized embedding right away, or wake the worker
+    if cached:
+        try:
+            from app.services.face_gallery import gallery
+            gallery.upsert(case_id, unpack_embedding(cached), data.get("missing_full_name"),
+                           data.get("complainant_phone"), version)
+        except Exception as e:
+            print(f"Gallery update error: {e}")
+    else:
+        embedding_worker.notify()
     
     return case_id
 
-def get_recent_cases(limit=10):
+# ── Case listing (keyset pagination) ───────────────────────────────────────────
+
+# Columns a case list needs; the embedding BLOB and complainant details stay in the DB
+CASE_LIST_COLUMNS = (
+    "id", "missing_full_name", "gender", "age", "missing_state", "missing_city",
+    "missing_date", "image_path", "status", "embedding_status", "embedding_error", "created_at",
+)
+CASE_PAGE_SIZE = 25
+CASE_PAGE_MAX = 100
+
+
+def encode_cursor(created_at, case_id: int) -> str:
+    raw = json.dumps([created_at, case_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    (created_at, id) of the last case on the previous page; ValueError if malformed.
+    """
+    try:
+        created_at, case_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(case_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_cases(limit: int = CASE_PAGE_SIZE, cursor: str = None, status: str = None,
+               state: str = None, date_from: str = None, date_to: str = None) -> tuple:
+    """
+    One page of cases, newest first, seeking on (created_at, id) so every
+    page costs the same however deep it is. `date_from` / `date_to` filter
+    on the missing date (YYYY-MM-DD, inclusive).
+    Returns (cases, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), CASE_PAGE_MAX))
+    where, params = [], []
+    if cursor:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if state:
+        where.append("missing_state = ?")
+        params.append(state)
+    if date_from:
+        where.append("missing_date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("missing_date <= ?")
+        params.append(date_to)
+
+    sql = f"SELECT {', '.join(CASE_LIST_COLUMNS)} FROM cases"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cases ORDER BY created_at DESC LIMIT ?", (limit,))
-    cases = cursor.fetchall()
+    rows = conn.execute(sql, params).fetchall()
     conn.close()
-    return cases
+
+    cases = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = cases[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return cases, next_cursor
+
 
 def get_case_by_id(case_id):
     conn = get_connection()
@@ -107,47 +240,26 @@ def get_case_by_id(case_id):
 
 def get_case_stats_by_date():
     """
-    Returns case counts grouped by missing_date.
+    Returns case counts grouped by missing_date (from the materialised case_stats).
     """
+    from app.services.stats_service import case_stats
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # DEBUG: Total count check
-        cursor.execute("SELECT COUNT(*) FROM cases")
-        total = cursor.fetchone()[0]
-        print(f"DEBUG STATS: Total cases in DB = {total}")
-        
-        # DEBUG: Raw values check
-        cursor.execute("SELECT id, missing_date FROM cases LIMIT 10")
-        sample = cursor.fetchall()
-        for s in sample:
-            print(f"  Sample Case {s[0]}: date='{s[1]}'")
-
-        cursor.execute("SELECT missing_date, COUNT(*) FROM cases GROUP BY missing_date")
-        rows = cursor.fetchall()
-        conn.close()
-        
-        stats = []
-        for row in rows:
-            d = row[0]
-            count = row[1]
-            print(f"  Grouped: date='{d}', count={count}")
-            if d and str(d).strip():
-                stats.append({
-                    "missing_date": str(d),
-                    "count": int(count)
-                })
-        
-        stats.sort(key=lambda x: x["missing_date"])
-        print(f"DEBUG STATS: Returning {len(stats)} entries: {stats}")
-        return stats
+        return [{"missing_date": row["bucket"], "count": row["count"]} for row in case_stats.series("day")]
     except Exception as e:
-        with open("emergency_debug.txt", "a") as f:
-            f.write(f"ERROR: {e}\n")
+        print(f"[Stats] Could not load case statistics: {e}")
         return []
 
-def debug_to_file(msg):
-    with open("emergency_debug.txt", "a") as f:
-        import datetime
-        f.write(f"[{datetime.datetime.now()}] {msg}\n")
+
+# ── Async API (for route handlers; queries run on the DB executor) ────────────
+
+async def save_case_async(data: dict, image_chunks: list, ext: str):
+    return await run_db(save_case, data, image_chunks, ext)
+
+async def list_cases_async(*args, **kwargs) -> tuple:
+    return await run_db(list_cases, *args, **kwargs)
+
+async def get_case_by_id_async(case_id):
+    return await run_db(get_case_by_id, case_id)
+
+async def get_case_stats_by_date_async():
+    return await run_db(get_case_stats_by_date)
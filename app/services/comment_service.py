@@ -0,0 +1,23 @@
+from app.models.database import get_connection, run_db
+
+
+def get_case_comments(case_id: int) -> list:
+    """
+    Comments and leads logged on a case, oldest first.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, author_name, message, created_at FROM comments "
+        "WHERE case_id = ? ORDER BY created_at, id",
+        (case_id,),
+    )
+    comments = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return comments
+
+
+# ── Async API ─────────────────────────────────────────────────────────────────
+
+async def get_case_comments_async(case_id: int) -> list:
+    return await run_db(get_case_comments, case_id)
@@ -1,42 +1,198 @@
-import sqlite3
-import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'database.db')
+import re
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+from app.config import config
+from app.models.database import get_connection, run_db
 
-def get_all_cases_summary():
+CASE_COLUMNS = "id, missing_full_name, age, gender, missing_city, missing_state, status, created_at"
+
+# Candidate cases fetched per lookup before the token budget trims them
+MAX_CONTEXT_CASES = 40
+MAX_QUERY_TERMS = 24
+RECENT_IN_SUMMARY = 10
+
+STATUS_WORDS = {"pending": "Pending", "open": "Pending", "active": "Pending",
+                "found": "Found", "located": "Found", "recovered": "Found",
+                "closed": "Closed"}
+
+# Words that never identify a case (also skipped as name prefixes)
+STOP_WORDS = {
+    "the", "and", "for", "are", "was", "were", "who", "what", "when", "where", "which", "how",
+    "many", "much", "any", "all", "there", "their", "this", "that", "with", "from", "about",
+    "missing", "person", "persons", "people", "case", "cases", "report", "reported", "reports",
+    "list", "show", "tell", "give", "find", "know", "have", "has", "been", "still", "status",
+    "child", "children", "kid", "kids", "boy", "girl", "man", "woman", "please", "can", "you",
+    "help", "information", "info", "details", "detail", "latest", "recent", "city", "state",
+    "total", "number", "count", "summary", "overview", "database", "system", "registered",
+}
+AGGREGATE_HINTS = {"how many", "total", "count", "number of", "summary", "overview",
+                   "statistics", "stats", "who is missing", "list", "all cases", "recent"}
+
+
+# ── Retrieval-scoped chat context ─────────────────────────────────────────────
+#
+# Rather than dumping every case into the prompt, the chat context holds only
+# the cases a message refers to — by name, place, description or lead text
+# (full-text search), or by city, state or status — trimmed to a token
+# budget, plus a compact summary from the materialised statistics for
+# aggregate questions. Its size and cost stay flat however many cases the
+# database holds.
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _query_terms(message: str) -> list:
+    words = re.findall(r"[^\W\d_]+", message.lower())
+    terms = [w for w in words if len(w) >= 3 and w not in STOP_WORDS and w not in STATUS_WORDS]
+    # Two-word places ("new delhi", "tamil nadu")
+    terms += [f"{a} {b}" for a, b in zip(words, words[1:])
+              if a not in STOP_WORDS and b not in STOP_WORDS]
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def _case_line(case) -> str:
+    return (f"- #{case['id']} {case['missing_full_name']} ({case['age']}y/o, {case['gender']}) "
+            f"from {case['missing_city']}, {case['missing_state']}. Status: {case['status']}. "
+            f"Reported on: {case['created_at']}")
+
+
+def find_relevant_cases(message: str, limit: int = MAX_CONTEXT_CASES) -> list:
     """
-    Returns a compact text summary of all cases for the AI chatbot context.
+    Cases the message refers to, best first: full-text matches on names,
+    descriptions and leads (ranked, typo-tolerant), then exact city / state
+    matches (newest first); optionally narrowed by a status word. Every
+    lookup is an index search.
     """
-    try:
+    from app.services.search_service import search_cases
+
+    lowered = message.lower()
+    statuses = sorted({status for word, status in STATUS_WORDS.items()
+                       if re.search(rf"\b{word}\b", lowered)})
+    terms = _query_terms(message)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    places, place_words = {}, set()
+    status_filter = f" AND status IN ({', '.join('?' * len(statuses))})" if statuses else ""
+    for term in terms:
+        for column in ("missing_city", "missing_state"):
+            cursor.execute(
+                f"SELECT {CASE_COLUMNS} FROM cases WHERE {column} = ? COLLATE NOCASE{status_filter} "
+                "ORDER BY created_at DESC LIMIT ?",
+                [term] + statuses + [limit],
+            )
+            rows = cursor.fetchall()
+            if rows:
+                place_words.update(term.split())
+            for row in rows:
+                places.setdefault(row["id"], row)
+    # search_cases takes its own pooled connection; holding this one across
+    # it could starve the pool under concurrent chat requests
+    conn.close()
+
+    # Words that named a place are already covered by the lookups above
+    found = {}
+    words = [term for term in terms if " " not in term and term not in place_words]
+    if words:
+        for row in search_cases(" ".join(words), limit=limit, any_term=True,
+                                status=statuses[0] if len(statuses) == 1 else None):
+            if not statuses or row["status"] in statuses:
+                found[row["id"]] = row
+    for case_id, row in places.items():
+        found.setdefault(case_id, row)
+
+    if not found and statuses:
+        # "Which cases are still pending?" — the newest cases with that status
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, missing_full_name, age, gender, missing_city, missing_state, status, created_at FROM cases ORDER BY created_at DESC")
-        cases = cursor.fetchall()
+        rows = conn.execute(
+            f"SELECT {CASE_COLUMNS} FROM cases WHERE status IN ({', '.join('?' * len(statuses))}) "
+            "ORDER BY created_at DESC LIMIT ?",
+            statuses + [limit],
+        ).fetchall()
         conn.close()
+        found = {row["id"]: row for row in rows}
+    return list(found.values())[:limit]
 
-        if not cases:
-            return "No missing person cases are currently registered in the system."
-
-        summary_lines = ["Current Missing Person Cases in Database:"]
-        for case in cases:
-            # Safely handle missing fields if any
-            name = case['missing_full_name']
-            age = case['age']
-            gender = case['gender']
-            city = case['missing_city']
-            state = case['missing_state']
-            status = case['status']
-            date = case['created_at']
-            
-            line = f"- {name} ({age}y/o, {gender}) from {city}, {state}. Status: {status}. Reported on: {date}"
-            summary_lines.append(line)
-        
-        return "\n".join(summary_lines)
+
+def get_cases_overview() -> str:
+    """
+    Compact aggregate summary (totals by status, busiest states, newest cases)
+    built from the materialised statistics — constant size and cost.
+    """
+    from app.services.stats_service import case_stats
+
+    totals = case_stats.totals()
+    total = sum(totals.values())
+    if not total:
+        return "No missing person cases are currently registered in the system."
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT state, SUM(count) AS n FROM case_stats WHERE grain = 'month' AND state != '' "
+        "GROUP BY state ORDER BY n DESC LIMIT 5"
+    )
+    states = cursor.fetchall()
+    cursor.execute(f"SELECT {CASE_COLUMNS} FROM cases ORDER BY created_at DESC LIMIT ?", (RECENT_IN_SUMMARY,))
+    recent = cursor.fetchall()
+    conn.close()
+
+    lines = [f"Total registered cases: {total} ("
+             + ", ".join(f"{status}: {n}" for status, n in sorted(totals.items())) + ")."]
+    if states:
+        lines.append("Most cases by state: " + ", ".join(f"{row['state']} ({row['n']})" for row in states) + ".")
+    lines.append(f"{len(recent)} most recent cases:")
+    lines += [_case_line(case) for case in recent]
+    return "\n".join(lines)
+
+
+def get_chat_context(message: str, token_budget: int = None) -> str:
+    """
+    Database context for one chat message, at most `token_budget` tokens:
+    the matching cases in `find_relevant_cases` order (ranked full-text hits
+    first, then place matches newest first), and/or the aggregate overview
+    when the question is general or nothing specific matched.
+    """
+    token_budget = token_budget or config.CHAT_CONTEXT_TOKENS
+    try:
+        cases = find_relevant_cases(message)
+        lowered = message.lower()
+        aggregate = not cases or any(hint in lowered for hint in AGGREGATE_HINTS)
+
+        sections, used = [], 0
+        if cases:
+            header = f"Cases matching the question ({len(cases)}{'+' if len(cases) >= MAX_CONTEXT_CASES else ''}):"
+            lines, used = [header], estimate_tokens(header)
+            for case in cases:
+                line = _case_line(case)
+                cost = estimate_tokens(line)
+                if used + cost > token_budget:
+                    lines.append(f"(… {len(cases) - len(lines) + 1} more matching cases not shown)")
+                    break
+                lines.append(line)
+                used += cost
+            sections.append("\n".join(lines))
+
+        if aggregate:
+            overview = get_cases_overview()
+            remaining = token_budget - used
+            if estimate_tokens(overview) > remaining:
+                # Keep whole lines that fit; the totals line always comes first
+                kept, cost = [], 0
+                for line in overview.split("\n"):
+                    cost += estimate_tokens(line)
+                    if kept and cost > remaining:
+                        break
+                    kept.append(line)
+                overview = "\n".join(kept)
+            sections.append(overview)
+
+        return "\n\n".join(sections)
     except Exception as e:
-        print(f"Error in get_all_cases_summary: {e}")
+        print(f"Error in get_chat_context: {e}")
         return "Internal error: Could not retrieve missing persons data."
+
+
+async def get_chat_context_async(message: str, token_budget: int = None) -> str:
+    return await run_db(get_chat_context, message, token_budget)
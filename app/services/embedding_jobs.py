@@ -0,0 +1,273 @@
+import time
+import asyncio
+
+from app.config import config
+from app.models.database import get_connection, run_db, pack_embedding, unpack_embedding
+from app.services.upload_store import upload_path
+
+# How often the worker re-checks the queue when nothing woke it up
+POLL_INTERVAL = 5.0
+
+
+class EmbeddingJobWorker:
+    """
+    Durable background queue that computes face embeddings for new cases.
+
+    Jobs live in the `embedding_jobs` table, so nothing is lost on restart.
+    A job is claimed with a time-limited lease (`locked_until`); a worker
+    that dies mid-job simply lets the lease expire and the job is picked up
+    again. Failures are retried with exponential backoff; after
+    `max_attempts` the case is marked 'failed' and the job is parked until
+    an officer retries it.
+    """
+
+    def __init__(self, concurrency: int = 2, max_attempts: int = 5,
+                 retry_base: float = 30.0, lease_seconds: float = 300.0):
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+
+        self._loop = None
+        self._task = None
+        self._wake = None
+        self._running = set()
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self):
+        """
+        Start the worker on the running event loop (call from app startup).
+        """
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        for job in list(self._running):
+            job.cancel()
+        await asyncio.gather(task, *self._running, return_exceptions=True)
+        self._running.clear()
+
+    def notify(self):
+        """
+        Wake the worker because a job was queued. Safe to call from any thread.
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # ── Queue management ──────────────────────────────────────────────────────
+
+    def retry(self, case_id: int) -> bool:
+        """
+        Re-queue a case (e.g. after it failed). Returns False if the case does not exist.
+        """
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE cases SET embedding_status = 'pending', embedding_error = NULL WHERE id = ?",
+            (case_id,),
+        )
+        if cursor.rowcount == 0:
+            conn.close()
+            return False
+        cursor.execute("""
+            INSERT INTO embedding_jobs (case_id, attempts, next_attempt_at, locked_until, last_error)
+            VALUES (?, 0, ?, NULL, NULL)
+            ON CONFLICT(case_id) DO UPDATE SET
+                attempts = 0, next_attempt_at = excluded.next_attempt_at,
+                locked_until = NULL, last_error = NULL
+        """, (case_id, time.time()))
+        conn.commit()
+        conn.close()
+        self.notify()
+        return True
+
+    def stats(self) -> dict:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT embedding_status, COUNT(*) AS n FROM cases GROUP BY embedding_status")
+        counts = {row["embedding_status"] or "pending": row["n"] for row in cursor.fetchall()}
+        conn.close()
+        return {
+            "pending": counts.get("pending", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "running": len(self._running),
+        }
+
+    # ── Worker loop ───────────────────────────────────────────────────────────
+
+    async def _run(self):
+        print("[Embeddings] Job worker started.")
+        while True:
+            try:
+                free = self.concurrency - len(self._running)
+                jobs = await run_db(self._claim, free) if free > 0 else []
+                for job in jobs:
+                    task = asyncio.create_task(self._process(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._job_finished)
+                if jobs and len(self._running) < self.concurrency:
+                    continue  # there may be more due work
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Embeddings] Queue poll failed: {e}")
+
+            self._wake.clear()
+            timeout = await run_db(self._idle_timeout)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _job_finished(self, task):
+        self._running.discard(task)
+        # A slot freed up: look for the next due job without waiting for the poll
+        if self._wake is not None:
+            self._wake.set()
+
+    def _idle_timeout(self) -> float:
+        # Sleep until the next backoff expires, but never longer than the poll interval
+        try:
+            conn = get_connection()
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM embedding_jobs "
+                "WHERE next_attempt_at IS NOT NULL AND locked_until IS NULL"
+            ).fetchone()
+            conn.close()
+        except Exception:
+            return POLL_INTERVAL
+        if row is None or row["due"] is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.05, row["due"] - time.time()))
+
+    def _claim(self, limit: int) -> list:
+        """
+        Lease up to `limit` due jobs. Returns rows with the case fields the job needs.
+        """
+        now = time.time()
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT j.case_id, j.attempts, c.image_path, c.image_hash,
+                   c.missing_full_name, c.complainant_phone
+            FROM embedding_jobs j JOIN cases c ON c.id = j.case_id
+            WHERE j.next_attempt_at IS NOT NULL AND j.next_attempt_at <= ?
+              AND (j.locked_until IS NULL OR j.locked_until < ?)
+            ORDER BY j.next_attempt_at
+            LIMIT ?
+        """, (now, now, limit))
+        candidates = cursor.fetchall()
+
+        claimed = []
+        for row in candidates:
+            cursor.execute(
+                "UPDATE embedding_jobs SET locked_until = ? "
+                "WHERE case_id = ? AND (locked_until IS NULL OR locked_until < ?)",
+                (now + self.lease_seconds, row["case_id"], now),
+            )
+            if cursor.rowcount:
+                claimed.append(dict(row))
+        conn.commit()
+        conn.close()
+        return claimed
+
+    async def _process(self, job: dict):
+        from app.services.inference_service import inference
+        from app.services.case_service import compute_case_embedding
+
+        case_id = job["case_id"]
+        image_path = upload_path(job["image_path"])
+        try:
+            # The same photo may have been embedded since this job was queued
+            blob = await run_db(self._cached, job["image_hash"])
+            if blob is not None:
+                embedding = unpack_embedding(blob)
+            else:
+                embedding = await inference.run(compute_case_embedding, image_path,
+                                                timeout=self.lease_seconds)
+                blob = pack_embedding(embedding)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await run_db(self._fail, case_id, job["attempts"] + 1, str(e) or type(e).__name__)
+            return
+
+        await run_db(self._complete, case_id, blob, job["image_hash"])
+        try:
+            from app.services.face_gallery import gallery
+            gallery.upsert(case_id, embedding, job["missing_full_name"], job["complainant_phone"],
+                           config.EMBEDDING_VERSION)
+        except Exception as e:
+            print(f"[Embeddings] Gallery update error for case {case_id}: {e}")
+
+        # Render the dashboard / case page thumbnails while the photo is still warm in the page cache
+        from app.services.thumbnails import thumbnails
+        await asyncio.to_thread(thumbnails.warm, job["image_path"])
+
+    def _cached(self, image_hash: str):
+        from app.services.case_service import embedding_fingerprint, get_cached_embedding
+
+        conn = get_connection()
+        blob = get_cached_embedding(conn.cursor(), image_hash, embedding_fingerprint())
+        conn.close()
+        return blob
+
+    def _complete(self, case_id: int, blob: bytes, image_hash: str = None):
+        from app.services.case_service import cache_embedding, case_pipeline, embedding_fingerprint
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        cache_embedding(cursor, image_hash, embedding_fingerprint(), blob)
+        cursor.execute(
+            "UPDATE cases SET embedding = ?, embedding_version = ?, embedding_pipeline = ?, "
+            "embedding_status = 'done', embedding_error = NULL WHERE id = ?",
+            (blob, config.EMBEDDING_VERSION, case_pipeline(), case_id),
+        )
+        cursor.execute("DELETE FROM embedding_jobs WHERE case_id = ?", (case_id,))
+        conn.commit()
+        conn.close()
+        print(f"[Embeddings] Case {case_id} embedded.")
+
+    def _fail(self, case_id: int, attempts: int, error: str):
+        conn = get_connection()
+        cursor = conn.cursor()
+        if attempts >= self.max_attempts:
+            # Park the job (no next attempt) until an officer retries it
+            cursor.execute(
+                "UPDATE embedding_jobs SET attempts = ?, next_attempt_at = NULL, "
+                "locked_until = NULL, last_error = ? WHERE case_id = ?",
+                (attempts, error, case_id),
+            )
+            cursor.execute(
+                "UPDATE cases SET embedding_status = 'failed', embedding_error = ? WHERE id = ?",
+                (error, case_id),
+            )
+            print(f"[Embeddings] Case {case_id} failed after {attempts} attempt(s): {error}")
+        else:
+            delay = self.retry_base * (2 ** (attempts - 1))
+            cursor.execute(
+                "UPDATE embedding_jobs SET attempts = ?, next_attempt_at = ?, "
+                "locked_until = NULL, last_error = ? WHERE case_id = ?",
+                (attempts, time.time() + delay, error, case_id),
+            )
+            cursor.execute("UPDATE cases SET embedding_error = ? WHERE id = ?", (error, case_id))
+            print(f"[Embeddings] Case {case_id} attempt {attempts} failed, retrying in {delay:.0f}s: {error}")
+        conn.commit()
+        conn.close()
+
+
+embedding_worker = EmbeddingJobWorker(
+    concurrency=config.EMBEDDING_JOB_CONCURRENCY,
+    max_attempts=config.EMBEDDING_MAX_ATTEMPTS,
+    retry_base=config.EMBEDDING_RETRY_BASE_SECONDS,
+    lease_seconds=config.EMBEDDING_JOB_LEASE_SECONDS,
+)
@@ -0,0 +1,622 @@
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+import numpy as np
+
+from app.config import config
+from app.models.database import get_connection, run_db
+from app.services.ann_index import create_index
+
+# ArcFace produces 512-d embeddings
+EMBEDDING_DIM = 512
+
+# Shortlist size requested from an ANN index when the caller gives no k
+DEFAULT_SHORTLIST_K = 50
+
+# Retrain the ANN quantizer once the gallery outgrows the training set this much
+RETRAIN_GROWTH = 4
+
+# Re-embed checkpoints are stamped when written but visible only once their
+# batch commits, so each sync looks back this far (re-applying a row is harmless)
+SYNC_OVERLAP_SECONDS = 10
+
+
+def index_path(version: str) -> str:
+    """
+    Where the ANN index for one embedding version is persisted.
+    """
+    root, ext = os.path.splitext(config.FACE_INDEX_PATH)
+    return f"{root}.{version}{ext}"
+
+
+def normalize_embedding(embedding) -> np.ndarray:
+    """
+    Convert an embedding (list / array) to a unit-length float32 vector.
+    """
+    vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vec)
+    if norm == 0 or not np.isfinite(norm):
+        raise ValueError("Embedding has zero or invalid norm")
+    return vec / norm
+
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    Decode a stored embedding column to a float32 vector.
+    Accepts the binary float32 BLOB format and legacy JSON text.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype="<f4")
+    return np.asarray(json.loads(value), dtype=np.float32)
+
+
+def select_top_k(distances, top_k: int = None, max_distance: float = None) -> np.ndarray:
+    """
+    Indices of the `top_k` smallest distances (optionally <= max_distance),
+    sorted ascending. Uses partial selection: O(n + k log k), not a full sort.
+    """
+    candidates = None
+    if max_distance is not None:
+        candidates = np.flatnonzero(distances <= max_distance)
+        distances = distances[candidates]
+
+    n = distances.shape[0]
+    if top_k is not None and 0 < top_k < n:
+        order = np.argpartition(distances, top_k - 1)[:top_k]
+    else:
+        order = np.arange(n)
+    order = order[np.argsort(distances[order], kind="stable")]
+
+    return order if candidates is None else candidates[order]
+
+
+class FaceGallery:
+    """
+    Process-resident gallery of the case embeddings of one embedding version.
+
+    Embeddings are kept as one pre-normalised float32 matrix with a parallel
+    array of case ids, so matching a probe is a single matrix-vector product.
+    The gallery is loaded lazily from the database on first use and kept in
+    sync incrementally through `upsert` / `remove`.
+
+    An optional ANN index (see `ann_index.py`, selected by `FACE_INDEX`)
+    narrows each query to a shortlist, which is then reranked exactly
+    against the float32 matrix.
+    """
+
+    def __init__(self, version: str, dim: int = EMBEDDING_DIM):
+        self.version = version
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._loaded = False
+
+        # Row storage grows geometrically so inserts are amortised O(1)
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+
+        self._row_of = {}   # case_id -> row index
+        self._meta = {}     # case_id -> {"name", "complainant_phone"}
+
+        self._index = self._new_index()
+        self._index_building = False
+        self._dirty = None  # ids changed while an index rebuild is in flight
+
+    # ── Loading ───────────────────────────────────────────────────────────────
+
+    def load(self, rows: list = None):
+        """
+        (Re)build the whole gallery from the cases table, or from `rows`
+        already selected for this version.
+        """
+        if rows is None:
+            conn = get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, missing_full_name, embedding, complainant_phone "
+                "FROM cases WHERE embedding != '' AND embedding_version = ?",
+                (self.version,),
+            )
+            rows = cursor.fetchall()
+            conn.close()
+
+        ids, vectors, meta = [], [], {}
+        for row in rows:
+            try:
+                vec = decode_embedding(row["embedding"])
+            except (ValueError, TypeError):
+                continue
+            if vec.shape[0] != self.dim:
+                continue
+            ids.append(row["id"])
+            vectors.append(vec)
+            meta[row["id"]] = {
+                "name": row["missing_full_name"],
+                "complainant_phone": row["complainant_phone"],
+            }
+
+        matrix = np.empty((0, self.dim), dtype=np.float32)
+        if vectors:
+            # Binary rows are normalised at write time; re-normalise in one pass
+            # anyway so legacy JSON rows (mid-migration) are handled uniformly.
+            matrix = np.vstack(vectors).astype(np.float32)
+            norms = np.linalg.norm(matrix, axis=1)
+            valid = (norms > 0) & np.isfinite(norms)
+            matrix = matrix[valid] / norms[valid, None]
+            ids = [case_id for case_id, ok in zip(ids, valid.tolist()) if ok]
+            meta = {case_id: meta[case_id] for case_id in ids}
+
+        with self._lock:
+            self._matrix = matrix
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._size = len(ids)
+            self._row_of = {case_id: i for i, case_id in enumerate(ids)}
+            self._meta = meta
+            self._loaded = True
+
+        print(f"[Gallery] Loaded {self._size} {self.version} case embedding(s).")
+        self._init_index()
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    # ── Incremental updates ───────────────────────────────────────────────────
+
+    def upsert(self, case_id: int, embedding, name: str = None, complainant_phone: str = None):
+        """
+        Insert or replace the embedding for one case.
+        No-op until the gallery has been loaded (the load will pick the row up).
+        """
+        vec = normalize_embedding(embedding)
+        if vec.shape[0] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embedding, got {vec.shape[0]}")
+
+        with self._lock:
+            if not self._loaded:
+                return
+            row = self._row_of.get(case_id)
+            if row is None:
+                if self._size == self._matrix.shape[0]:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._ids[row] = case_id
+                self._row_of[case_id] = row
+            self._matrix[row] = vec
+            self._meta[case_id] = {"name": name, "complainant_phone": complainant_phone}
+            self._index.add(case_id, vec)
+            if self._dirty is not None:
+                self._dirty.add(case_id)
+            self._maybe_rebuild_index()
+
+    def remove(self, case_id: int):
+        """
+        Drop a case from the gallery (swap-with-last, O(1)).
+        """
+        with self._lock:
+            row = self._row_of.pop(case_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._row_of[moved_id] = row
+            self._size = last
+            self._meta.pop(case_id, None)
+            self._index.remove(case_id)
+            if self._dirty is not None:
+                self._dirty.add(case_id)
+
+    def _grow(self):
+        capacity = max(64, self._matrix.shape[0] * 2)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+
+    # ── ANN index ─────────────────────────────────────────────────────────────
+
+    def _new_index(self):
+        return create_index(
+            config.FACE_INDEX, self.dim,
+            nlist=config.ANN_NLIST,
+            nprobe=config.ANN_NPROBE,
+            rerank=config.ANN_RERANK,
+            min_train=config.ANN_MIN_TRAIN,
+        )
+
+    def _init_index(self):
+        """
+        Restore the persisted index if there is one, otherwise train a new one.
+        """
+        if config.FACE_INDEX == "brute":
+            return
+        index = self._new_index()
+        if index.load(index_path(self.version)):
+            with self._lock:
+                # Reconcile with the current gallery contents by case id
+                indexed = index.indexed_ids()
+                for case_id in indexed - set(self._row_of):
+                    index.remove(case_id)
+                for case_id in set(self._row_of) - indexed:
+                    index.add(case_id, self._matrix[self._row_of[case_id]])
+                self._index = index
+            print(f"[Gallery] Restored {self.version} {index.name} index ({len(index)} entries).")
+        else:
+            with self._lock:
+                self._index = index
+                self._maybe_rebuild_index()
+
+    def _maybe_rebuild_index(self):
+        # Caller holds self._lock
+        if self._index_building or config.FACE_INDEX == "brute":
+            return
+        if self._index.trained:
+            if self._size < self._index.trained_size * RETRAIN_GROWTH:
+                return
+        elif self._size < config.ANN_MIN_TRAIN:
+            return
+        self._index_building = True
+        self._dirty = set()
+        threading.Thread(target=self._rebuild_index, name=f"gallery-index-{self.version}",
+                         daemon=True).start()
+
+    def _rebuild_index(self):
+        """
+        Train a fresh index on a snapshot (off-lock), then replay changes made meanwhile.
+        """
+        try:
+            with self._lock:
+                ids = self._ids[:self._size].copy()
+                matrix = self._matrix[:self._size].copy()
+
+            index = self._new_index()
+            index.build(ids, matrix)
+
+            with self._lock:
+                for case_id in self._dirty:
+                    row = self._row_of.get(case_id)
+                    if row is None:
+                        index.remove(case_id)
+                    else:
+                        index.add(case_id, self._matrix[row])
+                self._index = index
+            print(f"[Gallery] Built {self.version} {index.name} index over {len(ids)} embedding(s).")
+            self.save_index()
+        except Exception as e:
+            print(f"[Gallery] Index build failed: {e}")
+        finally:
+            with self._lock:
+                self._dirty = None
+                self._index_building = False
+
+    def save_index(self):
+        with self._lock:
+            try:
+                self._index.save(index_path(self.version))
+            except Exception as e:
+                print(f"[Gallery] Could not save index: {e}")
+
+    # ── Matching ──────────────────────────────────────────────────────────────
+
+    def match(self, probe_embedding, k: int = None):
+        """
+        Cosine distance from the probe to gallery cases.
+        Returns (case_ids, distances) as parallel numpy arrays (unsorted).
+
+        With exact search every case is scored. With an ANN index only the
+        shortlist for the `k` nearest is scored (exactly, in float32).
+        """
+        self.ensure_loaded()
+        probe = normalize_embedding(probe_embedding)
+        with self._lock:
+            shortlist = self._index.candidates(probe, k or DEFAULT_SHORTLIST_K)
+            if shortlist is None:
+                matrix = self._matrix[:self._size]
+                distances = 1.0 - matrix @ probe
+                ids = self._ids[:self._size].copy()
+            else:
+                rows = np.fromiter((self._row_of[c] for c in shortlist.tolist()),
+                                   dtype=np.int64, count=shortlist.shape[0])
+                distances = 1.0 - self._matrix[rows] @ probe
+                ids = self._ids[rows]
+        return ids, distances
+
+    def search(self, probe_embedding, top_k: int = None, max_distance: float = None):
+        """
+        Best matches for a probe: (case_ids, distances) sorted by distance,
+        at most `top_k` long and limited to `max_distance` when given.
+        """
+        ids, distances = self.match(probe_embedding, k=top_k)
+        order = select_top_k(distances, top_k, max_distance)
+        return ids[order], distances[order]
+
+    def search_many(self, probe_embeddings, top_k: int = None, max_distance: float = None) -> list:
+        """
+        Batched `search` for several probes (e.g. every face in a frame).
+        With exact search the whole probe set is scored with one
+        matrix-matrix product. Returns a list of (case_ids, distances).
+        """
+        self.ensure_loaded()
+        probes = np.asarray(probe_embeddings, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        norms = np.linalg.norm(probes, axis=1, keepdims=True)
+        probes = probes / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            exact = not self._index.trained
+            if exact:
+                distances = 1.0 - probes @ self._matrix[:self._size].T
+                ids = self._ids[:self._size].copy()
+
+        if not exact:
+            return [self.search(p, top_k, max_distance) for p in probes]
+
+        out = []
+        for row in distances:
+            order = select_top_k(row, top_k, max_distance)
+            out.append((ids[order], row[order]))
+        return out
+
+    def meta(self, case_id: int) -> dict:
+        return self._meta.get(int(case_id), {})
+
+    def __len__(self):
+        self.ensure_loaded()
+        return self._size
+
+
+class VersionedGallery:
+    """
+    One `FaceGallery` per embedding version, side by side.
+
+    Vectors from different models live in different spaces, so a probe is
+    only ever compared with the gallery of its own version. While a model
+    migration is in progress the new version's gallery fills up as cases
+    are re-embedded (a case moves between galleries when its version
+    changes, including re-embeds written by reembed_cases.py, picked up by
+    `sync_reembedded`) and both stay searchable until the old one is empty.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._galleries = {}    # version -> FaceGallery
+        self._synced_at = None  # reembed_checkpoint time covered by the loaded rows
+        self._sync_task = None
+
+    # ── Loading ───────────────────────────────────────────────────────────────
+
+    def load(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        synced_at = cursor.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        cursor.execute(
+            "SELECT id, missing_full_name, embedding, complainant_phone, embedding_version "
+            "FROM cases WHERE embedding != '' AND embedding_version IS NOT NULL"
+        )
+        by_version = {}
+        for row in cursor.fetchall():
+            by_version.setdefault(row["embedding_version"], []).append(row)
+        conn.close()
+
+        galleries = {}
+        for version, rows in by_version.items():
+            galleries[version] = FaceGallery(version)
+            galleries[version].load(rows)
+        with self._lock:
+            self._galleries = galleries
+            self._synced_at = synced_at
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    async def ensure_loaded_async(self):
+        """
+        `ensure_loaded` for async routes: the first load reads the whole
+        cases table, so it runs on the DB executor, not the event loop.
+        """
+        if not self._loaded:
+            await run_db(self.ensure_loaded)
+
+    def _gallery_for(self, version: str) -> FaceGallery:
+        # Caller holds self._lock
+        gallery = self._galleries.get(version)
+        if gallery is None:
+            gallery = FaceGallery(version)
+            gallery.load([])
+            self._galleries[version] = gallery
+        return gallery
+
+    # ── Incremental updates ───────────────────────────────────────────────────
+
+    def upsert(self, case_id: int, embedding, name: str = None, complainant_phone: str = None,
+               version: str = None):
+        """
+        Insert or replace a case embedding of `version` (default: the active one).
+        No-op until the gallery has been loaded (the load will pick the row up).
+        """
+        version = version or config.EMBEDDING_VERSION
+        with self._lock:
+            if not self._loaded:
+                return
+            for other, gallery in self._galleries.items():
+                if other != version:
+                    gallery.remove(case_id)
+            self._gallery_for(version).upsert(case_id, embedding, name, complainant_phone)
+
+    def remove(self, case_id: int):
+        with self._lock:
+            for gallery in self._galleries.values():
+                gallery.remove(case_id)
+
+    def refresh_case(self, case_id: int):
+        """
+        Re-read a single case row from the database and apply it to the gallery.
+        """
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, missing_full_name, embedding, complainant_phone, embedding_version "
+            "FROM cases WHERE id = ?",
+            (case_id,),
+        )
+        row = cursor.fetchone()
+        conn.close()
+
+        if row is None:
+            self.remove(case_id)
+        else:
+            self._apply_row(row)
+
+    def _apply_row(self, row):
+        # A case row as stored: into the gallery of its version, or out of all of them
+        if not row["embedding"] or not row["embedding_version"]:
+            self.remove(row["id"])
+            return
+        try:
+            self.upsert(row["id"], decode_embedding(row["embedding"]), row["missing_full_name"],
+                        row["complainant_phone"], row["embedding_version"])
+        except (ValueError, TypeError):
+            self.remove(row["id"])
+
+    # ── Changes from other processes ──────────────────────────────────────────
+    #
+    # reembed_cases.py rewrites embeddings from a separate process and stamps
+    # each case in `reembed_checkpoint`. The app polls that table so cases
+    # move between version galleries while a re-embed runs, without a restart.
+
+    def sync_reembedded(self) -> int:
+        """
+        Apply the case embeddings re-embedded since the last sync. Returns
+        the number of cases refreshed.
+        """
+        if not self._loaded:
+            return 0
+        with self._lock:
+            since = self._synced_at
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            now = cursor.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+            cursor.execute(
+                "SELECT c.id, c.missing_full_name, c.embedding, c.complainant_phone, c.embedding_version "
+                "FROM reembed_checkpoint k JOIN cases c ON c.id = k.case_id "
+                "WHERE k.updated_at >= datetime(?, ?) AND k.status = 'done'",
+                (since, f"-{SYNC_OVERLAP_SECONDS} seconds"),
+            )
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            return 0    # no re-embed has ever run
+        finally:
+            conn.close()
+
+        for row in rows:
+            self._apply_row(row)
+        with self._lock:
+            self._synced_at = now
+        if rows:
+            print(f"[Gallery] Applied {len(rows)} re-embedded case(s).")
+        return len(rows)
+
+    def start_sync(self, interval: float):
+        """
+        Poll for re-embedded cases every `interval` seconds (call from app startup).
+        """
+        if self._sync_task is None and interval > 0:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(interval))
+
+    async def stop_sync(self):
+        task, self._sync_task = self._sync_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _sync_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_db(self.sync_reembedded)
+            except Exception as e:
+                print(f"[Gallery] Re-embed sync failed: {e}")
+
+    def save_index(self):
+        with self._lock:
+            galleries = list(self._galleries.values())
+        for gallery in galleries:
+            gallery.save_index()
+
+    # ── Matching ──────────────────────────────────────────────────────────────
+
+    def versions(self) -> list:
+        """
+        Versions that currently hold cases, the active version first.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            versions = [v for v, g in self._galleries.items() if g._size]
+        return sorted(versions, key=lambda v: v != config.EMBEDDING_VERSION)
+
+    def _get(self, version: str):
+        self.ensure_loaded()
+        with self._lock:
+            return self._galleries.get(version or config.EMBEDDING_VERSION)
+
+    def search(self, probe_embedding, top_k: int = None, max_distance: float = None,
+               version: str = None):
+        """
+        `FaceGallery.search` against the gallery of the probe's `version`.
+        """
+        gallery = self._get(version)
+        if gallery is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return gallery.search(probe_embedding, top_k, max_distance)
+
+    def search_many(self, probe_embeddings, top_k: int = None, max_distance: float = None,
+                    version: str = None) -> list:
+        """
+        `FaceGallery.search_many` against the gallery of the probes' `version`.
+        """
+        gallery = self._get(version)
+        if gallery is None:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [empty for _ in range(len(probe_embeddings))]
+        return gallery.search_many(probe_embeddings, top_k, max_distance)
+
+    def meta(self, case_id: int) -> dict:
+        with self._lock:
+            galleries = list(self._galleries.values())
+        for gallery in galleries:
+            meta = gallery.meta(case_id)
+            if meta:
+                return meta
+        return {}
+
+    def stats(self) -> dict:
+        self.ensure_loaded()
+        with self._lock:
+            return {
+                "active_version": config.EMBEDDING_VERSION,
+                "versions": {v: g._size for v, g in self._galleries.items()},
+            }
+
+    def __len__(self):
+        self.ensure_loaded()
+        with self._lock:
+            return sum(g._size for g in self._galleries.values())
+
+
+gallery = VersionedGallery()
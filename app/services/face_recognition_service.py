@@ -1,8 +1,12 @@
 import os
-import json
-import cv2
 import numpy as np
 import sys
+import time
+import queue
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError
 
 # Windows isolation fix: If twilio is missing from system path, check User Roaming site-packages
 try:
@@ -17,6 +21,8 @@ except ImportError:
         # Fallback for other potential python versions if needed
         pass
 
+from app.config import config
+
 # Lazy load DeepFace to keep application startup fast
 _deepface = None
 
@@ -29,55 +35,403 @@ def get_deepface():
 
 # ── Configuration ─────────────────────────────────────────────────────────────
 # opencv: ~2-5 sec (fast, good for live scan) | ssd: ~5-10 sec | retinaface: ~15-30 sec (most accurate)
-MODEL_NAME = "ArcFace"
 DETECTOR_BACKEND = os.getenv("DEEPFACE_DETECTOR", "opencv")
 DISTANCE_METRIC = "cosine"
-MATCH_THRESHOLD = 0.55   # Cosine distance; 0.55 is a good balance for ArcFace
 
+# Every stored embedding is tagged with the version that produced it.
+# Vectors of different versions live in different spaces and are never
+# compared; each version carries the cosine-distance threshold tuned for
+# its model. Add a new entry to roll out a new model (EMBEDDING_VERSION).
+EMBEDDING_VERSIONS = {
+    "arcface-v1":    {"model": "ArcFace",    "threshold": 0.68},
+    "facenet512-v1": {"model": "Facenet512", "threshold": 0.30},
+}
 
-def get_embedding(image_path: str) -> list:
+if config.EMBEDDING_VERSION not in EMBEDDING_VERSIONS:
+    raise ValueError(f"Unknown EMBEDDING_VERSION {config.EMBEDDING_VERSION!r}; "
+                     f"expected one of {sorted(EMBEDDING_VERSIONS)}")
+
+EMBEDDING_VERSION = config.EMBEDDING_VERSION
+MODEL_NAME = EMBEDDING_VERSIONS[EMBEDDING_VERSION]["model"]
+MATCH_THRESHOLD = EMBEDDING_VERSIONS[EMBEDDING_VERSION]["threshold"]
+
+
+def match_threshold(version: str = None) -> float:
     """
-    Extract a face embedding from an image file.
-    Ensures RGB conversion for consistency.
+    Cosine-distance cutoff for a confident match with embeddings of `version`.
+    """
+    return EMBEDDING_VERSIONS[version or EMBEDDING_VERSION]["threshold"]
+
+
+_models = {}
+
+
+def load_model(version: str = None):
+    """
+    Build (and cache) the recognition model of an embedding version
+    (default: the active one) in the current process / worker.
+    """
+    model_name = EMBEDDING_VERSIONS[version or EMBEDDING_VERSION]["model"]
+    if model_name not in _models:
+        DeepFace = get_deepface()
+        try:
+            _models[model_name] = DeepFace.build_model(task="facial_recognition", model_name=model_name)
+        except TypeError:
+            # Older DeepFace releases: build_model(model_name)
+            _models[model_name] = DeepFace.build_model(model_name)
+    return _models[model_name]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Detection / embedding stages (run on the inference pool)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def detect_faces(img, detector_backend: str = DETECTOR_BACKEND, enforce_detection: bool = True) -> list:
+    """
+    Detect and align faces in a BGR image (or image path).
+    Returns DeepFace's face objects: {"face": aligned RGB crop in [0, 1],
+    "facial_area": {...}, "confidence": float}.
     """
     DeepFace = get_deepface()
-    
-    # Load image and convert to RGB (DeepFace needs RGB for consistent embeddings)
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Could not read image at {image_path}")
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    result = DeepFace.represent(
-        img_path=img_rgb,
-        model_name=MODEL_NAME,
-        detector_backend=DETECTOR_BACKEND,
+    return DeepFace.extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
         align=True,
-        enforce_detection=True,
+        enforce_detection=enforce_detection,
     )
-    # Pick the largest face if multiple are found (DeepFace returns them sorted by size usually, but let's be safe)
-    best_face = result[0]
-    return best_face["embedding"]
 
 
-def embedding_from_frame(frame_bgr) -> list:
+def detect_faces_normalized(img, detector_backend: str = DETECTOR_BACKEND,
+                            enforce_detection: bool = True, max_side: int = None) -> list:
     """
-    Extract a face embedding directly from an OpenCV BGR numpy array.
-    Ensures RGB conversion before passing to DeepFace.
+    `detect_faces` for large photos: the image (path or BGR array) is made
+    upright from its EXIF orientation, detection runs on a copy downsampled
+    to `max_side` (DETECTION_MAX_SIDE), and the aligned crop is cut from the
+    full-resolution image. Same face objects as `detect_faces`, with
+    facial_area in full-resolution coordinates.
     """
+    from app.services.image_prep import aligned_crop, downscale, load_image, scale_area
+
+    if isinstance(img, str):
+        img = load_image(img)
+    small, scale = downscale(img, max_side or config.DETECTION_MAX_SIDE)
+    if scale == 1.0:
+        return detect_faces(img, detector_backend, enforce_detection)
+
     DeepFace = get_deepface()
-    
-    # CRITICAL: Convert BGR to RGB
-    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-    
-    result = DeepFace.represent(
-        img_path=frame_rgb,
-        model_name=MODEL_NAME,
-        detector_backend=DETECTOR_BACKEND,
-        align=True,
-        enforce_detection=True,
+    faces = DeepFace.extract_faces(
+        img_path=small,
+        detector_backend=detector_backend,
+        align=False,
+        enforce_detection=enforce_detection,
     )
-    return result[0]["embedding"]
+    out = []
+    for face in faces:
+        area = scale_area(face["facial_area"], scale)
+        crop = aligned_crop(img, area)
+        if crop is None:
+            continue    # degenerate box (no pixels in the frame)
+        out.append({
+            "face": crop,
+            "facial_area": area,
+            "confidence": face.get("confidence"),
+        })
+    if not out and enforce_detection:
+        raise ValueError("Face could not be detected in the image.")
+    return out
+
+
+def _prepare_face(face_rgb, model) -> np.ndarray:
+    # Exactly what DeepFace.represent does before the model — flip the RGB
+    # crop to BGR, resize, normalise — so vectors stay in the same space as
+    # every embedding stored through represent()
+    from deepface.modules import preprocessing
+    img = face_rgb[:, :, ::-1]
+    target_size = model.input_shape
+    img = preprocessing.resize_image(img=img, target_size=(target_size[1], target_size[0]))
+    return preprocessing.normalize_input(img=img, normalization="base")
+
+
+def embed_faces(faces: list, version: str = None) -> np.ndarray:
+    """
+    Embeddings of `version` (default: the active one) for a list of aligned
+    face crops, in ONE batched forward pass. Returns an (n, dim) float32 array.
+    """
+    model = load_model(version)
+    batch = np.concatenate([_prepare_face(face, model) for face in faces], axis=0)
+    return np.asarray(model.model(batch, training=False), dtype=np.float32)
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching for the embedding stage.
+
+    Face crops submitted by concurrent requests are collected for up to
+    `window_ms` (or until `max_batch` are waiting) and embedded with a
+    single `embed_faces` call per embedding version on the inference pool;
+    each caller gets its own row back. The batch-size distribution is kept
+    for observability.
+    """
+
+    def __init__(self, window_ms: float = 10, max_batch: int = 16):
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, face, version: str = None) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((face, version or EMBEDDING_VERSION, future))
+        return future
+
+    async def embed(self, face, version: str = None, timeout: float = None) -> np.ndarray:
+        """
+        Await the embedding of one aligned face crop.
+        """
+        return (await self.embed_many([face], version, timeout))[0]
+
+    async def embed_many(self, faces: list, version: str = None, timeout: float = None) -> list:
+        """
+        Await embeddings for several crops (they ride in the same batch when
+        possible), giving up after `timeout` (default: the inference timeout)
+        like `InferenceExecutor.run`.
+        """
+        from app.services.inference_service import inference
+
+        waiting = asyncio.gather(*(asyncio.wrap_future(self.submit(f, version)) for f in faces))
+        try:
+            return await asyncio.wait_for(waiting, timeout or inference.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Inference timed out — the server is busy, please retry.")
+
+    def _collect(self):
+        from app.services.inference_service import inference
+
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            by_version = {}
+            for face, version, fut in batch:
+                if not fut.cancelled():
+                    by_version.setdefault(version, []).append((face, fut))
+
+            # Hand each batch to the pool and go straight back to collecting
+            for version, group in by_version.items():
+                with self._lock:
+                    self._batch_sizes[len(group)] += 1
+                try:
+                    job = inference.submit(embed_faces, [face for face, _ in group], version)
+                except Exception as e:
+                    # e.g. the pool is shut down or a worker process died:
+                    # fail these callers and keep collecting
+                    self._fail(group, e)
+                    continue
+                job.add_done_callback(lambda j, group=group: self._distribute(j, group))
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, fut in batch:
+            try:
+                fut.set_exception(error)
+            except InvalidStateError:
+                pass    # caller already gave up on this one
+
+    @staticmethod
+    def _distribute(job, batch):
+        for i, (_, fut) in enumerate(batch):
+            try:
+                if job.cancelled():
+                    fut.cancel()
+                elif job.exception() is not None:
+                    fut.set_exception(job.exception())
+                else:
+                    fut.set_result(job.result()[i])
+            except InvalidStateError:
+                pass    # caller already gave up on this one
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = dict(sorted(self._batch_sizes.items()))
+        batches = sum(sizes.values())
+        items = sum(size * count for size, count in sizes.items())
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": batches,
+            "mean_batch_size": round(items / batches, 2) if batches else None,
+            "batch_size_histogram": sizes,
+            "queued": self._queue.qsize(),
+        }
+
+
+batcher = EmbeddingBatcher(window_ms=config.EMBED_BATCH_WINDOW_MS, max_batch=config.EMBED_MAX_BATCH)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Face tracking across frames (continuous scanning)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _box_iou(a: dict, b: dict) -> float:
+    ax2, ay2 = a["x"] + a["w"], a["y"] + a["h"]
+    bx2, by2 = b["x"] + b["w"], b["y"] + b["h"]
+    iw = max(0, min(ax2, bx2) - max(a["x"], b["x"]))
+    ih = max(0, min(ay2, by2) - max(a["y"], b["y"]))
+    inter = iw * ih
+    union = a["w"] * a["h"] + b["w"] * b["h"] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _centroid_gap(a: dict, b: dict) -> float:
+    # Centre distance relative to the box size (scale-free)
+    dx = (a["x"] + a["w"] / 2) - (b["x"] + b["w"] / 2)
+    dy = (a["y"] + a["h"] / 2) - (b["y"] + b["h"] / 2)
+    size = max(1.0, (a["w"] + a["h"] + b["w"] + b["h"]) / 4)
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+
+def face_quality(face: dict) -> float:
+    """
+    Cheap quality score for a detection: box area weighted by detector confidence.
+    """
+    area = face["facial_area"]
+    return area["w"] * area["h"] * max(float(face.get("confidence") or 0), 0.1)
+
+
+class FaceTrack:
+    def __init__(self, track_id: int, box: dict):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.embedding = None
+        self.results = None
+        self.quality = 0.0
+        self.embedded_at = 0.0
+
+
+class FaceTracker:
+    """
+    Lightweight IoU / centroid tracker over detector boxes.
+
+    Each face gets a stable track id across frames, and the embedding and
+    match results are cached per track. `update` flags a track for
+    re-embedding only when it is new, its detection quality improved
+    noticeably, or `refresh_interval` seconds have passed.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_gap: float = 0.5,
+                 max_missed: int = 5, refresh_interval: float = 5.0, quality_gain: float = 1.3):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_gap = max_centroid_gap
+        self.max_missed = max_missed
+        self.refresh_interval = refresh_interval
+        self.quality_gain = quality_gain
+
+        self._tracks = {}
+        self._next_id = 1
+        self.frames = 0
+        self.embeds = 0
+
+    def update(self, faces: list) -> list:
+        """
+        Associate this frame's detections with tracks.
+        Returns [(track, face, needs_embedding)] in detection order.
+        """
+        self.frames += 1
+        now = time.monotonic()
+
+        # Greedy association: best IoU pairs first, centroid gap as fallback
+        pairs = []
+        for i, face in enumerate(faces):
+            box = face["facial_area"]
+            for track in self._tracks.values():
+                iou = _box_iou(box, track.box)
+                if iou >= self.iou_threshold:
+                    pairs.append((1.0 + iou, i, track.track_id))
+                else:
+                    gap = _centroid_gap(box, track.box)
+                    if gap <= self.max_centroid_gap:
+                        pairs.append((1.0 - gap, i, track.track_id))
+        pairs.sort(reverse=True)
+
+        assigned, used = {}, set()
+        for _, i, track_id in pairs:
+            if i in assigned or track_id in used:
+                continue
+            assigned[i] = track_id
+            used.add(track_id)
+
+        out = []
+        for i, face in enumerate(faces):
+            track = self._tracks.get(assigned.get(i))
+            if track is None:
+                track = FaceTrack(self._next_id, face["facial_area"])
+                self._tracks[track.track_id] = track
+                self._next_id += 1
+            track.box = face["facial_area"]
+            track.missed = 0
+
+            quality = face_quality(face)
+            needs_embedding = (
+                track.embedding is None
+                or quality > track.quality * self.quality_gain
+                or now - track.embedded_at > self.refresh_interval
+            )
+            out.append((track, face, needs_embedding))
+
+        # Age out tracks that were not seen this frame
+        seen = {track.track_id for track, _, _ in out}
+        for track_id in list(self._tracks):
+            if track_id not in seen:
+                self._tracks[track_id].missed += 1
+                if self._tracks[track_id].missed > self.max_missed:
+                    del self._tracks[track_id]
+        return out
+
+    def record(self, track: FaceTrack, face: dict, embedding, results):
+        """
+        Cache a fresh embedding and match result on the track.
+        """
+        track.embedding = embedding
+        track.results = results
+        track.quality = face_quality(face)
+        track.embedded_at = time.monotonic()
+        self.embeds += 1
+
+    def stats(self) -> dict:
+        return {
+            "active_tracks": len(self._tracks),
+            "frames": self.frames,
+            "embeds": self.embeds,
+        }
+
+
+def get_embedding(image_path: str) -> list:
+    """
+    Extract a face embedding from an image file.
+    The photo is made upright from its EXIF orientation and detected at
+    working resolution; the aligned crop is taken at full resolution.
+    """
+    faces = detect_faces_normalized(image_path, DETECTOR_BACKEND)
+    # DeepFace returns the most prominent face first
+    return embed_faces([faces[0]["face"]])[0].tolist()
 
 
 def cosine_distance(emb1: list, emb2: list) -> float:
@@ -93,25 +447,3 @@ def cosine_distance(emb1: list, emb2: list) -> float:
     b = b / np.linalg.norm(b)
 
     return float(1.0 - np.dot(a, b))
-
-
-def match_against_cases(probe_embedding: list, cases: list) -> list:
-    """
-    Compare a probe embedding against all cases using consolidated logic.
-    """
-    results = []
-    for case in cases:
-        try:
-            stored_emb = json.loads(case["embedding"])
-        except (json.JSONDecodeError, TypeError):
-            continue
-
-        dist = cosine_distance(probe_embedding, stored_emb)
-        results.append({
-            "case": case,
-            "distance": round(dist, 4),
-            "matched": dist <= MATCH_THRESHOLD,
-        })
-
-    results.sort(key=lambda x: x["distance"])
-    return results
@@ -1,5 +1,5 @@
-import httpx
 from app.config import config
+from app.services.http_client import ProviderClient
 
 SYSTEM_PROMPT = """You are a helpful assistant for the National Missing Person Support System, specialized in child safety and recovery.
 Your primary goal is to guide users through the immediate steps when a child is missing:
@@ -18,6 +18,7 @@ MOCK_MODE = False  # Set to True once you have a working API key with quota
 class GeminiChatService:
     def __init__(self):
         self.api_key = config.GEMINI_API_KEY
+        self.http = ProviderClient("Gemini")
 
     def get_mock_response(self, user_message: str) -> str:
         msg = user_message.lower()
@@ -56,23 +57,22 @@ class GeminiChatService:
                 }
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{GEMINI_API_URL}?key={self.api_key}",
-                    json=payload,
-                )
-                
-                if response.status_code == 429:
-                    # Graceful Fallback: If 429 (Quota), return a high-quality mock response
-                    return self.get_mock_response(user_message)
-                
-                if response.status_code != 200:
-                    return self.get_mock_response(user_message)
-                
-                data = response.json()
-                print(f"DEBUG: Gemini full data: {data}")
-                reply = data["candidates"][0]["content"]["parts"][0]["text"]
-                return reply
+            response = await self.http.client.post(
+                f"{GEMINI_API_URL}?key={self.api_key}",
+                json=payload,
+            )
+
+            if response.status_code == 429:
+                # Graceful Fallback: If 429 (Quota), return a high-quality mock response
+                return self.get_mock_response(user_message)
+
+            if response.status_code != 200:
+                return self.get_mock_response(user_message)
+
+            data = response.json()
+            print(f"DEBUG: Gemini full data: {data}")
+            reply = data["candidates"][0]["content"]["parts"][0]["text"]
+            return reply
         except Exception as e:
             print(f"Gemini API error: {e}")
             return self.get_mock_response(user_message)
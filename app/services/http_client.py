@@ -0,0 +1,58 @@
+import importlib.util
+
+import httpx
+
+from app.config import config
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared LLM provider client
+#
+# Each chat provider keeps one AsyncClient for the life of the app, opened at
+# startup and closed at shutdown, so chat turns reuse kept-alive connections
+# instead of paying a TCP + TLS handshake per message. The pool limits bound
+# how many outbound connections a burst of chat traffic can open.
+# ─────────────────────────────────────────────────────────────────────────────
+
+class ProviderClient:
+    """
+    Lazily created, application-scoped httpx.AsyncClient for one provider.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._client = None
+
+    def _create(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.LLM_KEEPALIVE_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                config.LLM_READ_TIMEOUT,
+                connect=config.LLM_CONNECT_TIMEOUT,
+                pool=config.LLM_CONNECT_TIMEOUT,
+            ),
+        )
+
+    def start(self):
+        if self._client is None or self._client.is_closed:
+            self._client = self._create()
+            print(f"[HTTP] {self.name} client ready (http2={'on' if HTTP2_AVAILABLE else 'off'})")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Scripts that never run the app's startup hook still get a client
+        self.start()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
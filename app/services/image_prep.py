@@ -0,0 +1,165 @@
+import math
+import struct
+
+import cv2
+import numpy as np
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ingestion pre-processing for face detection
+#
+# Phone photos arrive at 12–16 MP and often sideways (the camera stores the
+# pixels unrotated plus an EXIF orientation tag). Images are decoded without
+# OpenCV's own orientation handling, rotated upright from the EXIF tag, and
+# detection runs on a downsampled working copy; the detected box and eye
+# positions are then mapped back so the aligned crop is cut from the
+# full-resolution image.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def exif_orientation(data: bytes) -> int:
+    """
+    EXIF orientation tag (1–8) of a JPEG, read from its APP1 segment.
+    Returns 1 (upright) when there is none.
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return 1
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return 1
+        marker = data[i + 1]
+        if marker in (0xD9, 0xDA):          # end of image / start of scan
+            return 1
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+            return _tiff_orientation(data[i + 10:i + 2 + length])
+        i += 2 + length
+    return 1
+
+
+def _tiff_orientation(tiff: bytes) -> int:
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return 1
+    if len(tiff) < 8:
+        return 1
+    ifd = struct.unpack(endian + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + "H", tiff[ifd:ifd + 2])[0]
+    for n in range(count):
+        entry = ifd + 2 + 12 * n
+        if entry + 12 > len(tiff):
+            break
+        tag = struct.unpack(endian + "H", tiff[entry:entry + 2])[0]
+        if tag == 0x0112:
+            value = struct.unpack(endian + "H", tiff[entry + 8:entry + 10])[0]
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def apply_orientation(img, orientation: int):
+    """
+    Rotate / mirror pixels so an image with EXIF `orientation` is upright.
+    """
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode_image(data: bytes):
+    """
+    Decode image bytes to an upright BGR array (None if undecodable).
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        return None
+    return apply_orientation(img, exif_orientation(data))
+
+
+def load_image(path: str):
+    """
+    Read an image file as an upright BGR array.
+    """
+    with open(path, "rb") as f:
+        img = decode_image(f.read())
+    if img is None:
+        raise ValueError(f"Could not read image at {path}")
+    return img
+
+
+def downscale(img, max_side: int) -> tuple:
+    """
+    Working copy whose longer side is at most `max_side`.
+    Returns (image, scale) where scale = working / original (1.0 if untouched).
+    """
+    height, width = img.shape[:2]
+    longest = max(height, width)
+    if not max_side or longest <= max_side:
+        return img, 1.0
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), scale
+
+
+def aligned_crop(img, area: dict):
+    """
+    Face crop from the full-resolution BGR image, rotated so the eyes are
+    level when both eye positions are known. Returns an RGB float crop in
+    [0, 1], the same format as DeepFace's aligned faces, or None when the
+    box holds no pixels (zero size, or entirely outside the frame).
+    """
+    height, width = img.shape[:2]
+    x, y, w, h = area["x"], area["y"], area["w"], area["h"]
+    left_eye, right_eye = area.get("left_eye"), area.get("right_eye")
+
+    # The box clipped to the frame
+    cx0, cy0 = max(0, x), max(0, y)
+    cx1, cy1 = min(width, x + w), min(height, y + h)
+    if cx1 <= cx0 or cy1 <= cy0:
+        return None
+
+    if left_eye and right_eye:
+        (lx, ly), (rx, ry) = sorted([left_eye, right_eye])
+        angle = math.degrees(math.atan2(ry - ly, rx - lx))
+        # Rotate a padded region about the eye midpoint so the crop has no empty corners
+        pad = int(max(w, h) * 0.5)
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+        region = img[y0:y1, x0:x1]
+        centre = ((lx + rx) / 2 - x0, (ly + ry) / 2 - y0)
+        matrix = cv2.getRotationMatrix2D(centre, angle, 1.0)
+        region = cv2.warpAffine(region, matrix, (region.shape[1], region.shape[0]),
+                                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        crop = region[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+    else:
+        crop = img[cy0:cy1, cx0:cx1]
+
+    return cv2.cvtColor(crop, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+
+
+def scale_area(area: dict, scale: float) -> dict:
+    """
+    Map a facial_area (box and eye points) from the working copy back to full resolution.
+    """
+    full = {k: int(round(area[k] / scale)) for k in ("x", "y", "w", "h")}
+    for eye in ("left_eye", "right_eye"):
+        if area.get(eye):
+            full[eye] = tuple(int(round(c / scale)) for c in area[eye])
+    return full
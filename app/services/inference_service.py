@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, ProcessPoolExecutor
+
+from app.config import config
+
+# Number of recent jobs kept for timing statistics
+TIMING_WINDOW = 200
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker-side helpers (module level so they can be pickled for process mode)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _init_worker():
+    """
+    Warm the ArcFace model before the first job. In process mode this loads
+    a separate model in each worker process; in thread mode every worker
+    thread gets the same process-wide model (the first one loads it).
+    """
+    try:
+        from app.services.face_recognition_service import load_model
+        load_model()
+        print(f"[Inference] Worker {os.getpid()}/{threading.current_thread().name} ready.")
+    except Exception as e:
+        print(f"[Inference] Worker model load failed: {e}")
+
+
+def _timed_call(fn, args, kwargs):
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+def _noop():
+    return None
+
+
+class InferenceExecutor:
+    """
+    Dedicated pool for blocking model work (DeepFace detection / ArcFace).
+
+    Routes `await executor.run(fn, *args)` so the event loop keeps serving
+    other requests while inference runs. Only "process" mode gives each
+    worker its own ArcFace model. "thread" mode shares ONE process-wide model
+    across all worker threads: Keras inference is thread-safe, and DeepFace
+    caches built models per process, so per-thread copies would only cost
+    memory. Pick process mode when workers must be isolated.
+    """
+
+    def __init__(self, workers: int = 2, mode: str = "thread", timeout: float = 60.0):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_ms = deque(maxlen=TIMING_WINDOW)
+        self._run_ms = deque(maxlen=TIMING_WINDOW)
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self, warm_up: bool = True):
+        with self._lock:
+            if self._pool is not None:
+                return
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker, thread_name_prefix="inference"
+                )
+        if warm_up:
+            # Spawn every worker now (each runs the initializer) instead of on first scan
+            for _ in range(self.workers):
+                self._pool.submit(_noop)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ── Submission ────────────────────────────────────────────────────────────
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` on the pool; returns a concurrent Future
+        resolving to the plain result.
+        """
+        if self._pool is None:
+            self.start(warm_up=False)
+
+        submitted = time.time()
+        with self._lock:
+            self._in_flight += 1
+
+        inner = self._pool.submit(_timed_call, fn, args, kwargs)
+        outer = Future()
+        # A caller giving up (timeout) drops the job if it has not started yet
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+
+        def _done(fut):
+            with self._lock:
+                self._in_flight -= 1
+            if fut.cancelled() or outer.cancelled():
+                outer.cancel()
+                return
+            try:
+                result, started, finished = fut.result()
+            except BaseException as e:
+                with self._lock:
+                    self._failed += 1
+                _settle(outer, exception=e)
+                return
+            with self._lock:
+                self._completed += 1
+                self._wait_ms.append((started - submitted) * 1000)
+                self._run_ms.append((finished - started) * 1000)
+            _settle(outer, result=result)
+
+        inner.add_done_callback(_done)
+        return outer
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Run `fn` on the pool and await its result without blocking the event loop.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise TimeoutError("Inference timed out — the server is busy, please retry.")
+
+    # ── Observability ─────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        with self._lock:
+            wait = sorted(self._wait_ms)
+            run = sorted(self._run_ms)
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_ms": _summary(wait),
+                "run_ms": _summary(run),
+            }
+
+
+def _settle(future, result=None, exception=None):
+    # The caller may have cancelled (timed out) while the job was finishing
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _summary(values: list) -> dict:
+    if not values:
+        return {"avg": None, "p50": None, "p95": None}
+    return {
+        "avg": round(sum(values) / len(values), 1),
+        "p50": round(values[len(values) // 2], 1),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+    }
+
+
+inference = InferenceExecutor(
+    workers=config.INFERENCE_WORKERS,
+    mode=config.INFERENCE_MODE,
+    timeout=config.INFERENCE_TIMEOUT,
+)
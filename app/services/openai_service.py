@@ -1,4 +1,3 @@
-import httpx
 import os
 from app.config import config
 
@@ -12,22 +11,24 @@ Your primary goal is to guide users through the immediate steps when a child is
 Be extremely empathetic, calm, and professional. Prioritize urgent safety advice above all else.
 Keep responses brief (2-3 sentences) to avoid overwhelming the user, unless they ask for specific procedural details."""
 
-from app.services.db_chat_service import get_all_cases_summary
+from app.services.db_chat_service import get_chat_context_async
+from app.services.http_client import ProviderClient
 
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
 class OpenAIChatService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
+        self.http = ProviderClient("OpenAI")
 
     async def get_response(self, user_message: str) -> str:
         if not self.api_key or self.api_key == "your_openai_key_here":
             return "Please configure the OpenAI API key in the .env file to enable the chatbot."
 
-        # Fetch the latest data from the database
-        db_context = get_all_cases_summary()
+        # Only the cases relevant to this message (plus an overview), within a token budget
+        db_context = await get_chat_context_async(user_message)
 
-        full_system_prompt = f"{SYSTEM_PROMPT}\n\nDATABASE CONTEXT:\n{db_context}\n\nUse the above database context to answer any questions about missing persons registered in the system. If a user asks who is missing, list the people from the context above. If they ask about a specific person, provide their details from the context."
+        full_system_prompt = f"{SYSTEM_PROMPT}\n\nDATABASE CONTEXT:\n{db_context}\n\nUse the above database context to answer any questions about missing persons registered in the system. If a user asks who is missing, list the people from the context above. If they ask about a specific person, provide their details from the context. The context lists only the cases relevant to this question, so use the totals it gives rather than counting lines."
 
         payload = {
             "model": "gpt-4o-mini",
@@ -45,20 +46,19 @@ class OpenAIChatService:
         }
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    OPENAI_API_URL,
-                    json=payload,
-                    headers=headers
-                )
-                
-                if response.status_code != 200:
-                    error_data = response.json()
-                    print(f"OpenAI API error: {error_data}")
-                    return "I'm having trouble connecting to OpenAI. Please check your API key and quota."
-                
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+            response = await self.http.client.post(
+                OPENAI_API_URL,
+                json=payload,
+                headers=headers
+            )
+
+            if response.status_code != 200:
+                error_data = response.json()
+                print(f"OpenAI API error: {error_data}")
+                return "I'm having trouble connecting to OpenAI. Please check your API key and quota."
+
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
         except Exception as e:
             print(f"OpenAI service error: {e}")
             return "An unexpected error occurred. Please try again later."
@@ -0,0 +1,143 @@
+import re
+
+from app.models.database import get_connection, run_db
+
+SEARCH_LIMIT = 20
+SEARCH_MAX = 100
+MAX_SEARCH_TERMS = 8
+
+# bm25 column weights: name, city, state, description, comments
+SEARCH_WEIGHTS = (10.0, 4.0, 3.0, 1.0, 1.0)
+
+# Words shorter than this are matched as prefixes only, never fuzzily
+FUZZY_MIN_LENGTH = 4
+FUZZY_MAX_CANDIDATES = 8
+
+# With a status filter, this many times `limit` top-ranked matches are considered
+STATUS_WINDOW = 5
+
+SEARCH_COLUMNS = ("c.id, c.missing_full_name, c.age, c.gender, c.missing_city, c.missing_state, "
+                  "c.status, c.image_path, c.created_at")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Case search
+#
+# `case_search` is an FTS5 index (rowid = case id) over names, places,
+# descriptions and comment text, kept current by triggers. Each query word
+# matches as a prefix ("pri" finds Priya); a word that starts no indexed term
+# is also expanded to indexed terms within a small edit distance, so typos
+# still match ("priyaa", "sharam"). Results are ranked by bm25 with the name
+# weighted highest.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def search_terms(text: str) -> list:
+    return list(dict.fromkeys(re.findall(r"\w+", text.lower())))[:MAX_SEARCH_TERMS]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    # Edit distance counting a swap of neighbouring letters as one edit
+    # (optimal string alignment), giving up once it exceeds `limit`
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _is_indexed_prefix(cursor, term: str) -> bool:
+    cursor.execute("SELECT 1 FROM case_search_terms WHERE term >= ? AND term < ? LIMIT 1",
+                   (term, term + "\uffff"))
+    return cursor.fetchone() is not None
+
+
+def _fuzzy_variants(cursor, term: str) -> list:
+    """
+    Indexed terms close to `term`: edit distance 1 (2 for long words), looked
+    up among terms starting with its first two letters, or with its first and
+    third (which covers a typo or swap at the second letter).
+    """
+    if len(term) < FUZZY_MIN_LENGTH:
+        return []
+    limit = 1 if len(term) <= 6 else 2
+    scored = {}
+    for prefix in {term[:2], term[0] + term[2]}:
+        cursor.execute(
+            "SELECT term, doc FROM case_search_terms WHERE term >= ? AND term < ? "
+            "AND length(term) BETWEEN ? AND ?",
+            (prefix, prefix + "\uffff", len(term) - limit, len(term) + limit),
+        )
+        for row in cursor.fetchall():
+            if row["term"] == term or row["term"] in scored:
+                continue
+            distance = _edit_distance(term, row["term"], limit)
+            if distance <= limit:
+                scored[row["term"]] = (distance, -row["doc"])
+    return sorted(scored, key=scored.get)[:FUZZY_MAX_CANDIDATES]
+
+
+def build_match(terms: list, variants: dict = None, any_term: bool = False) -> str:
+    """
+    FTS5 MATCH expression: every word as a prefix (plus fuzzy variants), ANDed (or ORed).
+    """
+    groups = []
+    for term in terms:
+        options = [f'"{term}"*'] + [f'"{v}"' for v in (variants or {}).get(term, [])]
+        groups.append(options[0] if len(options) == 1 else "(" + " OR ".join(options) + ")")
+    return (" OR " if any_term else " AND ").join(groups)
+
+
+def _run_match(cursor, match: str, limit: int, status: str = None) -> list:
+    # Rank inside the index first and only join the top rows to cases; a
+    # status filter is applied to a wider window of top-ranked candidates
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    window = limit * STATUS_WINDOW if status else limit
+    sql = (f"SELECT {SEARCH_COLUMNS}, hits.score FROM ("
+           f"    SELECT rowid, bm25(case_search, {weights}) AS score FROM case_search"
+           "     WHERE case_search MATCH ? ORDER BY score LIMIT ?"
+           ") hits JOIN cases c ON c.id = hits.rowid")
+    params = [match, window]
+    if status:
+        sql += " WHERE c.status = ?"
+        params.append(status)
+    cursor.execute(sql + " ORDER BY hits.score LIMIT ?", params + [limit])
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def search_cases(query: str, limit: int = SEARCH_LIMIT, status: str = None,
+                 any_term: bool = False, fuzzy: bool = True) -> list:
+    """
+    Best-matching cases for free text, most relevant first. With `any_term`
+    a case needs to match only one of the words (used for chat messages).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(int(limit), SEARCH_MAX))
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    variants = {}
+    if fuzzy:
+        # Only words that are not the start of any indexed term are treated as typos
+        for term in terms:
+            if len(term) >= FUZZY_MIN_LENGTH and not _is_indexed_prefix(cursor, term):
+                variants[term] = _fuzzy_variants(cursor, term)
+    results = _run_match(cursor, build_match(terms, variants, any_term), limit, status)
+    conn.close()
+    for row in results:
+        row["score"] = round(-row["score"], 4)     # higher is better
+    return results
+
+
+async def search_cases_async(*args, **kwargs) -> list:
+    return await run_db(search_cases, *args, **kwargs)
@@ -0,0 +1,120 @@
+import time
+import datetime
+import threading
+
+from app.config import config
+from app.models.database import get_connection, STATS_GRAINS
+
+# Ranges longer than this (in days) are summarised by week, then by month
+AUTO_WEEK_AFTER_DAYS = 92
+AUTO_MONTH_AFTER_DAYS = 2 * 366
+
+
+def _bucket_of(grain: str, value: str) -> str:
+    """
+    The case_stats bucket a YYYY-MM-DD date falls into.
+    """
+    if grain == "month":
+        return value[:7]
+    if grain == "week":
+        day = datetime.date.fromisoformat(value[:10])
+        return (day - datetime.timedelta(days=day.weekday())).isoformat()
+    return value
+
+
+def pick_grain(start: str = None, end: str = None) -> str:
+    """
+    Coarsest grain that still gives a readable chart for the range.
+    """
+    if not start or not end:
+        return "day"
+    span = (datetime.date.fromisoformat(end[:10]) - datetime.date.fromisoformat(start[:10])).days
+    if span > AUTO_MONTH_AFTER_DAYS:
+        return "month"
+    if span > AUTO_WEEK_AFTER_DAYS:
+        return "week"
+    return "day"
+
+
+class CaseStatsCache:
+    """
+    Read side of the materialised `case_stats` table (kept current by
+    triggers on `cases`). Results are cached in-process for `ttl` seconds;
+    writers in this process call `invalidate()` so officers see their own
+    changes immediately, and the TTL bounds staleness for anything else
+    (scripts, other workers).
+    """
+
+    MAX_ENTRIES = 256
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] > now:
+                return hit[1]
+        value = compute()
+        with self._lock:
+            if len(self._cache) >= self.MAX_ENTRIES:
+                self._cache.clear()
+            self._cache[key] = (now + self.ttl, value)
+        return value
+
+    def series(self, grain: str = "day", start: str = None, end: str = None,
+               status: str = None, state: str = None) -> list:
+        """
+        Case counts per bucket, oldest first: [{"bucket": ..., "count": ...}].
+        Cases without a missing date are left out. Cost depends on the number
+        of buckets in the range, not on the number of cases.
+        """
+        if grain not in STATS_GRAINS:
+            raise ValueError(f"Unknown grain '{grain}' (expected one of {', '.join(STATS_GRAINS)})")
+        key = ("series", grain, start, end, status, state)
+        return self._cached(key, lambda: self._series(grain, start, end, status, state))
+
+    def _series(self, grain, start, end, status, state) -> list:
+        sql = "SELECT bucket, SUM(count) AS n FROM case_stats WHERE grain = ? AND bucket != ''"
+        params = [grain]
+        if start:
+            sql += " AND bucket >= ?"
+            params.append(_bucket_of(grain, start))
+        if end:
+            sql += " AND bucket <= ?"
+            params.append(_bucket_of(grain, end))
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        if state:
+            sql += " AND state = ?"
+            params.append(state)
+        sql += " GROUP BY bucket HAVING n > 0 ORDER BY bucket"
+
+        conn = get_connection()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return [{"bucket": row["bucket"], "count": int(row["n"])} for row in rows]
+
+    def totals(self) -> dict:
+        """
+        Case counts by status, including cases without a missing date.
+        """
+        def compute():
+            conn = get_connection()
+            rows = conn.execute(
+                "SELECT status, SUM(count) AS n FROM case_stats WHERE grain = 'month' GROUP BY status"
+            ).fetchall()
+            conn.close()
+            return {row["status"] or "Unknown": int(row["n"]) for row in rows if row["n"]}
+        return self._cached(("totals",), compute)
+
+
+case_stats = CaseStatsCache(ttl=config.STATS_CACHE_SECONDS)
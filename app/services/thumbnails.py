@@ -0,0 +1,124 @@
+import os
+import re
+import uuid
+import threading
+
+import cv2
+
+from app.config import config
+from app.services.image_prep import load_image, downscale
+from app.services.upload_store import hash_file
+
+# Fixed derivative sizes (longest side, in pixels)
+THUMB_SIZES = {"sm": 160, "md": 480, "lg": 1024}
+
+# Encoders per output format
+THUMB_FORMATS = {
+    "webp": (".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, 80]),
+    "jpg": (".jpg", "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, 82, cv2.IMWRITE_JPEG_PROGRESSIVE, 1]),
+}
+
+# Bump when the resize / encode settings change so cached derivatives and ETags roll over
+THUMB_REVISION = "1"
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Derivative image cache
+#
+# Dashboards and case pages show photos at a few fixed sizes, so each upload
+# is resized (EXIF-upright) and re-encoded once per size and format, lazily on
+# first request, and kept under THUMBNAIL_FOLDER keyed by the upload's content
+# hash. Because the source is content-addressed, a derivative never changes:
+# it is served with a strong ETag and an immutable, year-long Cache-Control.
+# ─────────────────────────────────────────────────────────────────────────────
+
+class ThumbnailCache:
+    def __init__(self, root: str):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._hashes = {}           # legacy (non content-addressed) path -> (mtime, hash)
+
+    def source_path(self, image_path: str) -> str:
+        """
+        Absolute path of an upload, refusing anything outside UPLOAD_FOLDER.
+        """
+        upload_root = os.path.realpath(config.UPLOAD_FOLDER)
+        path = os.path.realpath(os.path.join(upload_root, *image_path.split("/")))
+        if os.path.commonpath([upload_root, path]) != upload_root or not os.path.isfile(path):
+            raise FileNotFoundError(image_path)
+        return path
+
+    def source_hash(self, path: str) -> str:
+        # Content-addressed uploads carry their hash in the file name
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if _SHA256.match(stem):
+            return stem
+        mtime = os.path.getmtime(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        digest = hash_file(path)
+        self._hashes[path] = (mtime, digest)
+        return digest
+
+    def etag(self, image_hash: str, size: str, fmt: str) -> str:
+        return f'"{image_hash[:32]}-{size}-{fmt}-r{THUMB_REVISION}"'
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, image_path: str, size: str, fmt: str) -> tuple:
+        """
+        Derivative of an upload at a named size and format, generated on first use.
+        Returns (file_path, etag). Raises FileNotFoundError / KeyError.
+        """
+        if size not in THUMB_SIZES or fmt not in THUMB_FORMATS:
+            raise KeyError(f"{size}/{fmt}")
+        source = self.source_path(image_path)
+        image_hash = self.source_hash(source)
+        suffix = THUMB_FORMATS[fmt][0]
+        target = os.path.join(self.root, f"r{THUMB_REVISION}", size,
+                              image_hash[:2], image_hash[2:4], image_hash + suffix)
+        etag = self.etag(image_hash, size, fmt)
+        if os.path.exists(target):
+            return target, etag
+
+        # One request renders a given derivative; concurrent ones wait for it
+        with self._lock_for(target):
+            if not os.path.exists(target):
+                self._render(source, target, size, fmt)
+        with self._locks_guard:
+            self._locks.pop(target, None)
+        return target, etag
+
+    def _render(self, source: str, target: str, size: str, fmt: str):
+        suffix, _, params = THUMB_FORMATS[fmt]
+        img, _ = downscale(load_image(source), THUMB_SIZES[size])
+        ok, encoded = cv2.imencode(suffix, img, params)
+        if not ok:
+            raise ValueError(f"Could not encode {fmt} thumbnail for {source}")
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, target)
+
+    def warm(self, image_path: str, sizes: tuple = ("sm", "md"), formats: tuple = ("webp",)):
+        """
+        Pre-render the derivatives pages ask for first (e.g. right after ingest).
+        """
+        for size in sizes:
+            for fmt in formats:
+                try:
+                    self.get(image_path, size, fmt)
+                except Exception as e:
+                    print(f"[Thumbnails] Could not render {size}/{fmt} for {image_path}: {e}")
+                    return
+
+
+thumbnails = ThumbnailCache(config.THUMBNAIL_FOLDER)
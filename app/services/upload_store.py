@@ -0,0 +1,270 @@
+import os
+import uuid
+import struct
+import hashlib
+import posixpath
+
+from starlette.responses import RedirectResponse
+
+from app.config import config
+
+# Read / write granularity for streamed uploads
+CHUNK_SIZE = 1024 * 1024
+
+# The image header (JPEG SOF marker) must appear within this many bytes
+SNIFF_LIMIT = 512 * 1024
+
+# Room for the other form fields and multipart framing around the photo
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(ValueError):
+    """
+    An upload failed validation; the message is safe to show to the user.
+    """
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Validation
+#
+# Uploads are read in chunks (never more than MAX_UPLOAD_SIZE) and checked
+# from their header bytes — real type and pixel dimensions — before anything
+# is written to the upload store or handed to the model. This is not "before
+# any disk write": Starlette's multipart parser has already spooled parts
+# over 1 MB to a temporary file by the time a handler runs. What bounds that
+# spool is UploadSizeLimitMiddleware, which rejects oversized bodies first.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _jpeg_size(data: bytes):
+    # Walk the marker segments up to the first start-of-frame
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            raise UploadRejected("The photo is not a valid JPEG file.")
+        marker = data[i + 1]
+        if marker == 0xFF:          # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2                  # markers without a length
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def _webp_size(data: bytes):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+def sniff_image(header: bytes, complete: bool = False):
+    """
+    Identify an image from its leading bytes.
+    Returns (ext, width, height), or None if more bytes are needed.
+    Raises UploadRejected for anything that is not a supported image.
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        ext, size = "jpg", _jpeg_size(header)
+    elif header.startswith(b"\x89PNG\r\n\x1a\n"):
+        ext, size = "png", struct.unpack(">II", header[16:24]) if len(header) >= 24 else None
+    elif header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        ext, size = "webp", _webp_size(header)
+    elif len(header) < 12 and not complete:
+        return None
+    else:
+        raise UploadRejected("Unsupported file type — please upload a JPG, PNG or WEBP photo.")
+
+    if size is None:
+        if complete or len(header) >= SNIFF_LIMIT:
+            raise UploadRejected("The photo appears to be corrupted.")
+        return None
+    return ext, size[0], size[1]
+
+
+def check_image(ext: str, width: int, height: int):
+    allowed = {e.lower() for e in config.ALLOWED_EXTENSIONS}
+    if ext not in allowed and not (ext == "jpg" and "jpeg" in allowed):
+        raise UploadRejected(f"{ext.upper()} photos are not accepted.")
+    if min(width, height) < config.MIN_IMAGE_DIMENSION:
+        raise UploadRejected(f"The photo is too small ({width}×{height}); "
+                             f"at least {config.MIN_IMAGE_DIMENSION} pixels per side are needed.")
+    if width * height > config.MAX_IMAGE_PIXELS:
+        raise UploadRejected(f"The photo resolution is too large ({width}×{height}).")
+
+
+async def read_image_upload(upload, max_size: int = None) -> tuple:
+    """
+    Read an UploadFile (already parsed, possibly from Starlette's temporary
+    spool file) in chunks, enforcing the size cap and validating the image
+    header as soon as enough bytes have arrived. Nothing reaches the upload
+    store until this passes.
+    Returns (chunks, ext) ready for `store_stream`; raises UploadRejected.
+    """
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+
+    client_ext = os.path.splitext(upload.filename or "")[1].lstrip(".").lower()
+    if client_ext and client_ext not in {e.lower() for e in config.ALLOWED_EXTENSIONS}:
+        raise UploadRejected("Unsupported file type — please upload a JPG, PNG or WEBP photo.")
+
+    chunks, size, header, sniffed = [], 0, b"", None
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise UploadRejected(f"The photo is larger than {max_size // (1024 * 1024)} MB.")
+        chunks.append(chunk)
+        if sniffed is None:
+            header = (header + chunk)[:SNIFF_LIMIT]
+            sniffed = sniff_image(header)
+            if sniffed is not None:
+                check_image(*sniffed)
+
+    if size == 0:
+        raise UploadRejected("Please attach a photo of the missing person.")
+    if sniffed is None:
+        sniffed = sniff_image(header, complete=True)
+        check_image(*sniffed)
+    return chunks, sniffed[0]
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI guard for upload routes: requests whose body exceeds the photo cap
+    (plus form overhead) are turned away before the multipart parser spools
+    them to disk — up front from Content-Length, or mid-stream for chunked
+    bodies. The client is redirected back to `redirect_to` with an error code.
+    """
+
+    def __init__(self, app, paths: tuple = ("/report",), redirect_to: str = "/report?error=too_large"):
+        self.app = app
+        self.paths = set(paths)
+        self.redirect_to = redirect_to
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        limit = config.MAX_UPLOAD_SIZE + FORM_OVERHEAD
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > limit:
+            return await RedirectResponse(self.redirect_to, status_code=303)(scope, receive, send)
+
+        state = {"received": 0, "exceeded": False, "started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > limit:
+                    state["exceeded"] = True
+                    raise UploadRejected("Request body too large")
+            return message
+
+        async def guarded_send(message):
+            if state["exceeded"]:
+                return          # the app's error response is replaced below
+            state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadRejected:
+            if not state["exceeded"]:
+                raise
+        if state["exceeded"] and not state["started"]:
+            await RedirectResponse(self.redirect_to, status_code=303)(scope, receive, send)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Content-addressed upload store
+#
+# Every photo is stored once, under the SHA-256 of its bytes, in two levels
+# of 256-way shard directories: uploads/ab/cd/abcd….jpg. That keeps each
+# directory at a few dozen entries even with millions of uploads, and the
+# hash doubles as the key of the embedding cache.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def shard_path(image_hash: str, ext: str) -> str:
+    """
+    Path of a stored upload relative to UPLOAD_FOLDER (what `cases.image_path`
+    holds). Always "/"-separated: it is also the tail of /uploads and /thumbs
+    URLs, and must not change with the OS that stored it.
+    """
+    return posixpath.join(image_hash[:2], image_hash[2:4], f"{image_hash}.{ext}")
+
+
+def upload_path(image_path: str) -> str:
+    """
+    Filesystem path of a stored upload from its `cases.image_path` value.
+    """
+    return os.path.join(config.UPLOAD_FOLDER, *image_path.split("/"))
+
+
+def store_stream(chunks, ext: str) -> tuple:
+    """
+    Write an upload given as an iterable of byte chunks, hashing while it
+    streams to a temporary file. The file is then moved to its content
+    address; an identical photo already on disk is reused as is.
+    Returns (image_hash, relative_path).
+    """
+    tmp_dir = os.path.join(config.UPLOAD_FOLDER, ".incoming")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as buffer:
+            for chunk in chunks:
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        image_hash = digest.hexdigest()
+        relative_path = shard_path(image_hash, ext)
+        final_path = upload_path(relative_path)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)      # duplicate photo: keep the stored copy
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return image_hash, relative_path
+
+
+def iter_file(fileobj, chunk_size: int = CHUNK_SIZE):
+    """
+    Read a file object in chunks (for `store_stream`).
+    """
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter_file(f):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,105 @@
+"""
+bench_ann_index.py  –  recall / latency benchmark for the face gallery index
+=============================================================================
+Builds a synthetic gallery of unit-length 512-d "identities", queries it with
+noisy probes of registered people, and compares the IVF index (with exact
+reranking, as the gallery does it) against brute-force search.
+
+USAGE
+-----
+  python bench_ann_index.py
+
+  Optional flags:
+    --size     int    gallery size                     (default 100000)
+    --queries  int    number of probe queries          (default 200)
+    --k        int    recall@k cutoff                  (default 10)
+    --nprobe   list   nprobe values to sweep           (default 1,4,8,16,32)
+    --rerank   int    shortlist = k * rerank           (default 4)
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.services.ann_index import IVFIndex
+
+DIM = 512
+
+
+def make_gallery(size: int, rng):
+    # Clustered data: faces of similar-looking people share a coarse direction
+    n_clusters = max(1, size // 200)
+    centers = rng.standard_normal((n_clusters, DIM)).astype(np.float32)
+    gallery = centers[rng.integers(0, n_clusters, size)] + 0.8 * rng.standard_normal((size, DIM)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def make_probes(gallery, count: int, rng):
+    # A probe is a new photo of a registered person: their vector plus noise
+    picks = rng.choice(gallery.shape[0], count, replace=False)
+    probes = gallery[picks] + 0.04 * rng.standard_normal((count, DIM)).astype(np.float32)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return probes
+
+
+def brute_force_topk(gallery, probe, k: int):
+    distances = 1.0 - gallery @ probe
+    top = np.argpartition(distances, k - 1)[:k]
+    return top[np.argsort(distances[top])]
+
+
+def ivf_topk(index, gallery, probe, k: int):
+    shortlist = index.candidates(probe, k)
+    distances = 1.0 - gallery[shortlist] @ probe     # exact rerank
+    kk = min(k, shortlist.shape[0])
+    top = np.argpartition(distances, kk - 1)[:kk]
+    return shortlist[top[np.argsort(distances[top])]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN index recall/latency benchmark")
+    parser.add_argument("--size",    type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k",       type=int, default=10)
+    parser.add_argument("--nprobe",  default="1,4,8,16,32")
+    parser.add_argument("--rerank",  type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"[INFO] Generating gallery of {args.size} embeddings …")
+    gallery = make_gallery(args.size, rng)
+    probes = make_probes(gallery, args.queries, rng)
+    ids = np.arange(args.size, dtype=np.int64)      # row index doubles as case id
+
+    # ── Ground truth ─────────────────────────────────────────────────────────
+    t0 = time.perf_counter()
+    truth = [brute_force_topk(gallery, p, args.k) for p in probes]
+    brute_ms = (time.perf_counter() - t0) * 1000 / args.queries
+    print(f"[INFO] Brute force: {brute_ms:.2f} ms/query\n")
+
+    # ── IVF ──────────────────────────────────────────────────────────────────
+    index = IVFIndex(DIM, rerank=args.rerank, min_train=0)
+    t0 = time.perf_counter()
+    index.build(ids, gallery)
+    print(f"[INFO] IVF build: {time.perf_counter() - t0:.1f} s "
+          f"({len(index._lists)} lists)\n")
+
+    print(f"  {'nprobe':>6}  {'recall@1':>8}  {'recall@' + str(args.k):>9}  {'ms/query':>8}  {'speedup':>7}")
+    for nprobe in [int(x) for x in args.nprobe.split(",")]:
+        index.nprobe = nprobe
+        t0 = time.perf_counter()
+        found = [ivf_topk(index, gallery, p, args.k) for p in probes]
+        ivf_ms = (time.perf_counter() - t0) * 1000 / args.queries
+
+        recall_1 = np.mean([f[:1].tolist() == t[:1].tolist() for f, t in zip(found, truth)])
+        recall_k = np.mean([len(set(f.tolist()) & set(t.tolist())) / args.k for f, t in zip(found, truth)])
+        print(f"  {nprobe:>6}  {recall_1:>8.3f}  {recall_k:>9.3f}  {ivf_ms:>8.2f}  {brute_ms / ivf_ms:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,331 @@
 """
-Re-generate embeddings for ALL cases using the SAME detector chain as the live
-scan pipeline (retinaface → ssd → opencv → enforce_detection=False).
+reembed_cases.py  –  bulk re-embedding of every case photo
+===========================================================
+Re-generates the stored embeddings with the SAME detector chain and model
+as the app (`case_service.CASE_DETECTORS`, the active EMBEDDING_VERSION), so
+stored vectors stay consistent with what new reports and live scans produce.
+Each row is tagged with the embedding version / pipeline that produced it,
+which also makes this the tool for migrating to a new model: the app keeps
+serving both versions side by side while the re-embed runs. A running app
+picks up the rewritten embeddings from `reembed_checkpoint` every
+GALLERY_SYNC_SECONDS, so no restart is needed.
 
-IMPORTANT: Run this script whenever you change the detector order so that
-           stored embeddings stay consistent with the scan code.
+Cases are split into chunks and fanned out over a process pool. Every
+worker loads the model once, runs detection per photo and embeds the whole
+chunk in one batched forward pass. Results are written back in batched
+transactions together with a checkpoint row per case, so an interrupted
+run picks up where it stopped when started again. Photos whose content hash
+is already in the embedding cache for the current fingerprint skip
+inference entirely.
 
-Run: python reembed_cases.py
+Run this whenever the detector chain or model changes.
+
+USAGE
+-----
+  python reembed_cases.py
+
+  Optional flags:
+    --workers       int   worker processes                       (default: CPU count)
+    --batch-size    int   photos per worker chunk / forward pass (default 16)
+    --commit-every  int   rows per write transaction             (default 128)
+    --only-stale          skip cases already embedded with the current
+                          embedding version and detector pipeline
+    --fresh               ignore an unfinished previous run instead of resuming it
 """
-import json
-import sys
+import argparse
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app.models.database import get_connection
+from app.models.database import get_connection, init_db, pack_embedding
 from app.config import config
+from app.services.upload_store import upload_path
+
 
-print("Loading DeepFace (first run may download models, ~1 min)...")
-from deepface import DeepFace
-print("DeepFace loaded.\n")
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side (runs in the pool processes)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _init_worker():
+    try:
+        from app.services.face_recognition_service import load_model
+        load_model()
+    except Exception as e:
+        print(f"[WARN] Worker {os.getpid()} could not load the model: {e}")
 
-# ── MUST match the order in officer.py scan_frame AND case_service.save_case ──
-# opencv = fast and consistent with live scan
-DETECTORS = ["opencv", "ssd", "retinaface"]
 
+def embed_chunk(chunk: list) -> tuple:
+    """
+    Embed a chunk of (case_id, image_path) pairs.
+    Returns (results, detect_seconds, embed_seconds) where results holds
+    (case_id, embedding_blob or None, error or None) per case.
+    """
+    from app.services.case_service import detect_case_face
+    from app.services.face_recognition_service import embed_faces
 
-def get_embedding_with_fallback(image_path):
-    """Try detectors in the same priority as the live scan; last resort: enforce_detection=False."""
-    for backend in DETECTORS:
+    results, faces, face_ids = [], [], []
+    started = time.perf_counter()
+    for case_id, image_path in chunk:
+        if not os.path.exists(image_path):
+            results.append((case_id, None, f"Image file not found at: {image_path}"))
+            continue
         try:
-            results = DeepFace.represent(
-                img_path=image_path,
-                model_name="ArcFace",
-                detector_backend=backend,
-                align=True,
-                enforce_detection=True,
-            )
-            print(f"    ✅ Succeeded with detector: {backend}")
-            return results[0]["embedding"]
+            faces.append(detect_case_face(image_path))
+            face_ids.append(case_id)
         except Exception as e:
-            print(f"    ⚠️  {backend} failed: {e}")
+            results.append((case_id, None, f"All detectors failed: {e}"))
+    detected = time.perf_counter()
 
-    # Final fallback – no detection enforcement (whole-image embedding)
-    try:
-        results = DeepFace.represent(
-            img_path=image_path,
-            model_name="ArcFace",
-            detector_backend="opencv",
-            align=True,
-            enforce_detection=False,
+    if faces:
+        try:
+            embeddings = embed_faces(faces)
+            for case_id, embedding in zip(face_ids, embeddings):
+                results.append((case_id, pack_embedding(embedding), None))
+        except Exception as e:
+            results.extend((case_id, None, f"Embedding failed: {e}") for case_id in face_ids)
+
+    return results, detected - started, time.perf_counter() - detected
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Checkpointing
+# ─────────────────────────────────────────────────────────────────────────────
+
+def ensure_checkpoint_tables(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS reembed_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS reembed_checkpoint (
+            case_id INTEGER PRIMARY KEY,
+            run_id INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL,            -- 'done' or 'failed'
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        -- The running app polls recent checkpoints to refresh its gallery
+        CREATE INDEX IF NOT EXISTS idx_reembed_checkpoint_updated ON reembed_checkpoint(updated_at);
+    """)
+    conn.commit()
+
+
+def start_or_resume_run(conn, fingerprint: str, fresh: bool) -> tuple:
+    """
+    Returns (run_id, resumed). An unfinished run with the same fingerprint is
+    resumed unless `fresh` is set.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id FROM reembed_runs WHERE finished_at IS NULL AND fingerprint = ? "
+        "ORDER BY id DESC LIMIT 1",
+        (fingerprint,),
+    )
+    row = cursor.fetchone()
+    if row and not fresh:
+        return row["id"], True
+
+    # Close out abandoned runs so they are never resumed later
+    cursor.execute("UPDATE reembed_runs SET finished_at = CURRENT_TIMESTAMP WHERE finished_at IS NULL")
+    cursor.execute("INSERT INTO reembed_runs (fingerprint) VALUES (?)", (fingerprint,))
+    conn.commit()
+    return cursor.lastrowid, False
+
+
+def select_cases(conn, run_id: int, version: str, pipeline: str, only_stale: bool) -> tuple:
+    """
+    Cases still to process as (case_id, image_path) pairs, the skipped count
+    and {case_id: image_hash} for the embedding cache.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.id, c.image_path, c.image_hash, c.embedding != '' AS has_embedding,
+               c.embedding_version, c.embedding_pipeline, k.run_id, k.status
+        FROM cases c LEFT JOIN reembed_checkpoint k ON k.case_id = c.id
+        ORDER BY c.id
+    """)
+    todo, skipped, hashes = [], 0, {}
+    for row in cursor.fetchall():
+        done_this_run = row["run_id"] == run_id and row["status"] == "done"
+        up_to_date = (row["has_embedding"] and row["embedding_version"] == version
+                      and row["embedding_pipeline"] == pipeline)
+        if done_this_run or (only_stale and up_to_date):
+            skipped += 1
+            continue
+        todo.append((row["id"], upload_path(row["image_path"])))
+        if row["image_hash"]:
+            hashes[row["id"]] = row["image_hash"]
+    return todo, skipped, hashes
+
+
+def cached_results(conn, todo: list, hashes: dict, fingerprint: str) -> list:
+    """
+    Results for cases whose photo is already in the embedding cache for
+    this fingerprint (duplicates need no inference).
+    """
+    from app.services.case_service import get_cached_embedding
+
+    cursor = conn.cursor()
+    results = []
+    for case_id, _ in todo:
+        blob = get_cached_embedding(cursor, hashes.get(case_id), fingerprint)
+        if blob is not None:
+            results.append((case_id, blob, None))
+    return results
+
+
+def write_results(conn, run_id: int, fingerprint: str, version: str, pipeline: str,
+                  results: list, hashes: dict):
+    """
+    Persist a batch of results, their checkpoints and embedding cache
+    entries in one transaction.
+    """
+    embedded = [(blob, version, pipeline, case_id) for case_id, blob, _ in results if blob is not None]
+    checkpoints = [
+        (case_id, run_id, fingerprint, "done" if blob is not None else "failed", error)
+        for case_id, blob, error in results
+    ]
+    with conn:
+        conn.executemany(
+            "UPDATE cases SET embedding = ?, embedding_version = ?, embedding_pipeline = ?, "
+            "embedding_status = 'done', embedding_error = NULL WHERE id = ?",
+            embedded,
         )
-        print("    ✅ Succeeded with enforce_detection=False (fallback).")
-        return results[0]["embedding"]
-    except Exception as e:
-        raise RuntimeError(f"All detectors failed: {e}")
+        conn.executemany("DELETE FROM embedding_jobs WHERE case_id = ?",
+                         [(row[-1],) for row in embedded])
+        conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (image_hash, model_version, embedding) "
+            "VALUES (?, ?, ?)",
+            [(hashes[case_id], fingerprint, blob) for blob, _, _, case_id in embedded
+             if hashes.get(case_id)],
+        )
+        conn.executemany("""
+            INSERT INTO reembed_checkpoint (case_id, run_id, fingerprint, status, error)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(case_id) DO UPDATE SET
+                run_id = excluded.run_id, fingerprint = excluded.fingerprint,
+                status = excluded.status, error = excluded.error,
+                updated_at = CURRENT_TIMESTAMP
+        """, checkpoints)
 
 
-conn = get_connection()
-cursor = conn.cursor()
+def drop_stale_index(version: str):
+    # Stored vectors changed underneath any persisted ANN index: drop it so the
+    # app retrains on next start.
+    from app.services.face_gallery import index_path
 
-# Re-embed ALL cases so inconsistent old embeddings are fixed
-cursor.execute("SELECT id, missing_full_name, image_path FROM cases")
-cases = cursor.fetchall()
+    if os.path.exists(index_path(version)):
+        os.remove(index_path(version))
+        print(f"Removed stale face index at {index_path(version)}")
 
-if not cases:
-    print("No cases found in database.")
-    conn.close()
-    sys.exit(0)
 
-print(f"Found {len(cases)} case(s) to re-embed.\n")
+# ─────────────────────────────────────────────────────────────────────────────
+# Main
+# ─────────────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, resumable re-embedding of case photos")
+    parser.add_argument("--workers",      type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size",   type=int, default=16)
+    parser.add_argument("--commit-every", type=int, default=128)
+    parser.add_argument("--only-stale",   action="store_true")
+    parser.add_argument("--fresh",        action="store_true")
+    args = parser.parse_args()
+
+    from app.services.case_service import case_pipeline, embedding_fingerprint
+    version = config.EMBEDDING_VERSION
+    pipeline = case_pipeline()
+    fingerprint = embedding_fingerprint()
 
-success = 0
-failed  = 0
+    init_db()   # make sure the embedding_status / embedding_jobs schema exists
+    conn = get_connection()
+    ensure_checkpoint_tables(conn)
+    run_id, resumed = start_or_resume_run(conn, fingerprint, args.fresh)
+    todo, skipped, hashes = select_cases(conn, run_id, version, pipeline, args.only_stale)
 
-for case in cases:
-    image_path = os.path.join(config.UPLOAD_FOLDER, case["image_path"])
-    print(f"Case {case['id']}: {case['missing_full_name']}  ({case['image_path']})")
+    # Photos already embedded with this fingerprint are written straight from the cache
+    memoized = cached_results(conn, todo, hashes, fingerprint)
+    if memoized:
+        write_results(conn, run_id, fingerprint, version, pipeline, memoized, hashes)
+        done_ids = {case_id for case_id, _, _ in memoized}
+        todo = [item for item in todo if item[0] not in done_ids]
 
-    if not os.path.exists(image_path):
-        print(f"    ❌ Image file not found at: {image_path}\n")
-        failed += 1
-        continue
+    print(f"[INFO] Fingerprint: {fingerprint}")
+    print(f"[INFO] Run #{run_id} ({'resumed' if resumed else 'new'}): "
+          f"{len(todo)} case(s) to embed, {len(memoized)} from cache, {skipped} skipped.")
+    if not todo:
+        conn.execute("UPDATE reembed_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
+        conn.commit()
+        conn.close()
+        if memoized:
+            drop_stale_index(version)
+        return
+
+    chunks = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    workers = max(1, min(args.workers, len(chunks)))
+    print(f"[INFO] {len(chunks)} chunk(s) of up to {args.batch_size} over {workers} worker(s). "
+          f"Loading the {version} model in each worker (first run may download models) …\n")
+
+    success = failed = 0
+    detect_s = embed_s = 0.0
+    pending = []
+    started = time.perf_counter()
+    interrupted = False
 
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
     try:
-        embedding      = get_embedding_with_fallback(image_path)
-        embedding_json = json.dumps(embedding)
+        futures = [pool.submit(embed_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            results, chunk_detect, chunk_embed = future.result()
+            detect_s += chunk_detect
+            embed_s += chunk_embed
+            for case_id, blob, error in results:
+                if blob is None:
+                    failed += 1
+                    print(f"    ❌ Case {case_id}: {error}")
+                else:
+                    success += 1
+            pending.extend(results)
+            if len(pending) >= args.commit_every:
+                write_results(conn, run_id, fingerprint, version, pipeline, pending, hashes)
+                pending = []
 
-        update_cursor = conn.cursor()
-        update_cursor.execute(
-            "UPDATE cases SET embedding = ? WHERE id = ?",
-            (embedding_json, case["id"])
-        )
+            done = success + failed
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            eta = (len(todo) - done) / rate if rate else 0
+            print(f"  [{done:>6}/{len(todo)}]  {rate:6.2f} cases/s  ETA {eta:6.0f}s")
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n[WARN] Interrupted — saving progress …")
+    finally:
+        if pending:
+            write_results(conn, run_id, fingerprint, version, pipeline, pending, hashes)
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    if not interrupted:
+        conn.execute("UPDATE reembed_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
         conn.commit()
-        print(f"    💾 Saved embedding ({len(embedding)} dims).\n")
-        success += 1
-    except Exception as e:
-        print(f"    ❌ All detectors failed: {e}\n")
-        failed += 1
+    conn.close()
+
+    if success or memoized:
+        drop_stale_index(version)
+
+    elapsed = time.perf_counter() - started
+    processed = success + failed
+    print(f"\nDone{' (partial — run again to resume)' if interrupted else ''}. "
+          f"✅ {success} succeeded  ♻️  {len(memoized)} from cache  ❌ {failed} failed  ⏭  {skipped} skipped")
+    print(f"  Elapsed:    {elapsed:.1f} s")
+    print(f"  Throughput: {processed / max(elapsed, 1e-9):.2f} cases/s")
+    if processed:
+        print(f"  Detection:  {detect_s * 1000 / processed:.0f} ms/case (worker time)")
+        print(f"  Embedding:  {embed_s * 1000 / processed:.0f} ms/case (worker time, batched)")
+
 
-conn.close()
-print(f"Done. ✅ {success} succeeded  ❌ {failed} failed.")
+if __name__ == "__main__":
+    main()
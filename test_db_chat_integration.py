@@ -13,8 +13,8 @@ def check_db_content():
             print("❌ Database file not found.")
             return False
             
-        from app.services.db_chat_service import get_all_cases_summary
-        summary = get_all_cases_summary()
+        from app.services.db_chat_service import get_chat_context
+        summary = get_chat_context("How many cases are registered?")
         print("\n--- Current Database Summary for AI ---")
         print(summary)
         print("---------------------------------------\n")
@@ -8,7 +8,7 @@ USAGE
   python test_deepface.py --images sample_faces/
 
   Optional flags:
-    --threshold  float  cosine-distance cutoff        (default 0.55)
+    --threshold  float  cosine-distance cutoff        (default 0.68)
     --interval   float  seconds between checks        (default 3)
     --camera     int    webcam index                  (default 0)
 
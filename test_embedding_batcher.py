@@ -0,0 +1,64 @@
+"""
+Failure handling of the embedding micro-batcher: a batch the inference
+pool cannot take (pool shut down, worker process died) or never finishes
+must surface to the waiting caller as an error, not hang it.
+
+    python -m unittest test_embedding_batcher -v
+"""
+import asyncio
+import os
+import sys
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.face_recognition_service import EmbeddingBatcher
+from app.services.inference_service import inference
+
+FACE = np.zeros((112, 112, 3), dtype=np.float32)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class EmbeddingBatcherFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.batcher = EmbeddingBatcher(window_ms=1, max_batch=4)
+
+    def embed(self, timeout=None):
+        return asyncio.run(asyncio.wait_for(self.batcher.embed(FACE, timeout=timeout), 5))
+
+    def test_submit_failure_reaches_the_caller(self):
+        with mock.patch.object(inference, "submit", side_effect=RuntimeError("pool is shut down")):
+            with self.assertRaisesRegex(RuntimeError, "pool is shut down"):
+                self.embed()
+
+    def test_batcher_keeps_working_after_a_failed_submit(self):
+        results = [RuntimeError("worker died"), _done(np.ones((1, 512), dtype=np.float32))]
+
+        def submit(*args, **kwargs):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch.object(inference, "submit", side_effect=submit):
+            with self.assertRaises(RuntimeError):
+                self.embed()
+            self.assertEqual(self.embed().shape, (512,))
+
+    def test_unfinished_batch_times_out(self):
+        with mock.patch.object(inference, "submit", return_value=Future()):
+            with self.assertRaisesRegex(TimeoutError, "timed out"):
+                self.embed(timeout=0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Embedding parity test: the batched `embed_faces` pipeline must produce the
+same vectors as `DeepFace.represent`, which produced every stored legacy
+embedding. A difference here (channel order, resize, normalisation) puts
+new probes and stored cases in different spaces.
+
+    python -m unittest test_embedding_parity -v
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import face_recognition_service as frs
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_faces")
+
+
+class EmbeddingParityTest(unittest.TestCase):
+    def test_embed_faces_matches_represent(self):
+        DeepFace = frs.get_deepface()
+        for name in sorted(os.listdir(SAMPLES)):
+            with self.subTest(image=name):
+                face = frs.detect_faces(os.path.join(SAMPLES, name))[0]["face"]
+                ours = frs.embed_faces([face])[0]
+                theirs = DeepFace.represent(img_path=face, model_name=frs.MODEL_NAME,
+                                            detector_backend="skip")[0]["embedding"]
+                np.testing.assert_allclose(ours, np.asarray(theirs, dtype=np.float32),
+                                           rtol=1e-4, atol=1e-4)
+                self.assertLess(frs.cosine_distance(ours, theirs), 1e-5)
+
+    def test_batched_rows_match_single_faces(self):
+        faces = [frs.detect_faces(os.path.join(SAMPLES, name))[0]["face"]
+                 for name in sorted(os.listdir(SAMPLES))]
+        batched = frs.embed_faces(faces)
+        for i, face in enumerate(faces):
+            np.testing.assert_allclose(batched[i], frs.embed_faces([face])[0], rtol=1e-4, atol=1e-4)
+
+
+if __name__ == "__main__":
+    unittest.main()
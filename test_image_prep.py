@@ -0,0 +1,90 @@
+"""
+Tests for the large-photo detection path (app/services/image_prep.py).
+
+Photos larger than DETECTION_MAX_SIDE are detected on a downsampled copy
+and cropped with our own `aligned_crop`; smaller ones use DeepFace's
+alignment. The two must give equivalent crops and embeddings, and a
+degenerate detector box must not crash the crop.
+
+    python -m unittest test_image_prep -v
+"""
+import importlib.util
+import os
+import sys
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import config
+from app.services.image_prep import aligned_crop
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_faces")
+HAS_DEEPFACE = importlib.util.find_spec("deepface") is not None
+
+
+def _sample_near_threshold(name: str):
+    # Just over the threshold, so detect_faces_normalized takes the downsampled path
+    img = cv2.imread(os.path.join(SAMPLES, name))
+    scale = 1.1 * config.DETECTION_MAX_SIDE / max(img.shape[:2])
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+class AlignedCropBoxTest(unittest.TestCase):
+    img = np.full((200, 300, 3), 128, dtype=np.uint8)
+
+    def test_degenerate_boxes_give_no_crop(self):
+        for area in ({"x": 0, "y": 0, "w": 0, "h": 0},
+                     {"x": 50, "y": 50, "w": 40, "h": 0},
+                     {"x": 400, "y": 10, "w": 50, "h": 50},
+                     {"x": -80, "y": -80, "w": 50, "h": 50},
+                     {"x": 0, "y": 0, "w": 0, "h": 0, "left_eye": (1, 1), "right_eye": (2, 1)}):
+            with self.subTest(area=area):
+                self.assertIsNone(aligned_crop(self.img, area))
+
+    def test_box_partly_outside_is_clipped(self):
+        for eyes in ({}, {"left_eye": (10, 20), "right_eye": (30, 22)}):
+            with self.subTest(eyes=bool(eyes)):
+                crop = aligned_crop(self.img, {"x": -20, "y": 180, "w": 60, "h": 50, **eyes})
+                self.assertEqual(crop.shape, (20, 40, 3))
+                self.assertEqual(crop.dtype, np.float32)
+                self.assertTrue(0.0 <= crop.min() and crop.max() <= 1.0)
+
+
+@unittest.skipUnless(HAS_DEEPFACE, "deepface is not installed")
+class AlignmentParityTest(unittest.TestCase):
+    def test_aligned_crop_matches_deepface_alignment(self):
+        from app.services.face_recognition_service import detect_faces, embed_faces, cosine_distance
+
+        for name in sorted(os.listdir(SAMPLES)):
+            with self.subTest(image=name):
+                img = _sample_near_threshold(name)
+                reference = detect_faces(img)[0]
+                ours = aligned_crop(img, reference["facial_area"])
+                theirs = reference["face"]
+
+                size = (112, 112)
+                diff = np.abs(cv2.resize(ours, size) - cv2.resize(theirs.astype(np.float32), size)).mean()
+                self.assertLess(diff, 0.08, f"crops differ by {diff:.3f} on average")
+
+                vectors = embed_faces([ours, theirs])
+                self.assertLess(cosine_distance(vectors[0], vectors[1]), 0.1)
+
+    def test_large_photo_path_matches_deepface_path(self):
+        from app.services.face_recognition_service import (detect_faces, detect_faces_normalized,
+                                                           embed_faces, cosine_distance, match_threshold)
+
+        for name in sorted(os.listdir(SAMPLES)):
+            with self.subTest(image=name):
+                img = _sample_near_threshold(name)
+                downsampled = detect_faces_normalized(img)[0]["face"]
+                full = detect_faces(img)[0]["face"]
+                vectors = embed_faces([downsampled, full])
+                # Same person, same photo: far inside the match threshold
+                self.assertLess(cosine_distance(vectors[0], vectors[1]), match_threshold() / 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Query-plan regression tests for the hot queries.
+
+Builds a fresh database through init_db (so the migration path creates the
+indexes), calls the service functions the dashboard, chat, face gallery and
+embedding worker use while tracing the SQL they actually execute, runs
+EXPLAIN QUERY PLAN on every SELECT captured, and fails if one of them falls
+back to a full table scan or to sorting the whole table.
+
+    python -m unittest test_query_plans -v
+"""
+import contextlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app.models.database as database
+
+
+def _hot_calls():
+    """
+    (name, call) for each hot read path. Startup-only reads of every row
+    (e.g. loading the whole face gallery) scan by design and are left out.
+    """
+    from app.services.case_service import (list_cases, encode_cursor, get_case_by_id,
+                                           get_cached_embedding)
+    from app.services.comment_service import get_case_comments
+    from app.services.db_chat_service import find_relevant_cases
+    from app.services.embedding_jobs import embedding_worker
+    from app.services.search_service import search_cases
+    from app.services.stats_service import CaseStatsCache
+
+    stats = CaseStatsCache(ttl=0)
+    cursor = encode_cursor("2024-01-01 00:00:00", 10)
+
+    def cache_lookup():
+        conn = database.get_connection()
+        get_cached_embedding(conn.cursor(), "0" * 64, "arcface-v1/opencv/align")
+        conn.close()
+
+    return [
+        ("list_cases (first page)", lambda: list_cases(25)),
+        ("list_cases (next page)", lambda: list_cases(25, cursor)),
+        ("list_cases (status filter)", lambda: list_cases(25, cursor, status="Pending")),
+        ("list_cases (state filter)", lambda: list_cases(25, state="Kerala")),
+        ("case stats series", lambda: stats.series("week", "2024-01-01", "2024-12-30")),
+        ("case stats totals", stats.totals),
+        ("chat lookup (name, place, status)", lambda: find_relevant_cases("is priya from pune still pending?")),
+        ("chat lookup (status only)", lambda: find_relevant_cases("which cases are pending?")),
+        ("case search", lambda: search_cases("priya sharma", status="Pending")),
+        ("case search (typo)", lambda: search_cases("priyaa")),
+        ("get_case_by_id", lambda: get_case_by_id(1)),
+        ("case comments", lambda: get_case_comments(1)),
+        ("embedding queue stats", embedding_worker.stats),
+        ("embedding worker claim", lambda: embedding_worker._claim(4)),
+        ("embedding cache lookup", cache_lookup),
+    ]
+
+
+# "SCAN cases" without an index is a full table scan; "SCAN cases USING
+# COVERING INDEX ..." walks an index and is fine, and so is scanning a
+# subquery's rows (e.g. the top search hits).
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# Ranked full-text search sorts its matches by bm25; that sort is over the
+# matching rows only, not the table
+RANKED_SEARCH = re.compile(r"\bMATCH\b")
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.original_path = database.DB_PATH
+        database.DB_PATH = os.path.join(cls.tmp_dir, "plans.db")
+        database.init_db()
+        # Let the background (online) migrations finish before inspecting the schema
+        for thread in threading.enumerate():
+            if thread.name == "db-migrations":
+                thread.join(timeout=30)
+        cls.captured = cls.capture_hot_queries()
+        cls.conn = database.get_connection()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        database.get_pool().close_all()
+        database.DB_PATH = cls.original_path
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def captured_sql():
+        # Trace every connection the pool can hand out
+        pool = database.get_pool()
+        borrowed = [pool.acquire() for _ in range(pool.size)]
+        raw = [conn._conn for conn in borrowed]
+        for conn in borrowed:
+            conn.close()
+        statements = []
+        for conn in raw:
+            conn.set_trace_callback(statements.append)
+        try:
+            yield statements
+        finally:
+            for conn in raw:
+                conn.set_trace_callback(None)
+
+    @classmethod
+    def capture_hot_queries(cls) -> dict:
+        """
+        {name: [sql]} — every SELECT each hot call issues, parameters inlined.
+        """
+        captured = {}
+        for name, call in _hot_calls():
+            with cls.captured_sql() as statements:
+                call()
+            captured[name] = [sql for sql in statements
+                              if sql.lstrip().upper().startswith("SELECT") and " FROM " in sql.upper()]
+        return captured
+
+    def plan(self, sql, params=()):
+        rows = self.conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        return [row["detail"] for row in rows]
+
+    def hot_queries(self):
+        return [(name, sql) for name, queries in self.captured.items() for sql in queries]
+
+    def test_every_hot_call_is_traced(self):
+        for name, queries in self.captured.items():
+            with self.subTest(call=name):
+                self.assertTrue(queries, f"{name} issued no query")
+
+    def test_hot_queries_use_indexes(self):
+        tables = {row["name"] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name, sql in self.hot_queries():
+            with self.subTest(query=name, sql=sql):
+                plan = self.plan(sql)
+                scans = [step for step in plan
+                         if FULL_SCAN.match(step) and FULL_SCAN.match(step).group(1) in tables]
+                self.assertFalse(scans, f"{name} does a full table scan: {plan}")
+
+    def test_ordered_queries_do_not_sort(self):
+        for name, sql in self.hot_queries():
+            if "ORDER BY" not in sql.upper() or RANKED_SEARCH.search(sql):
+                continue
+            with self.subTest(query=name, sql=sql):
+                plan = self.plan(sql)
+                sorts = [step for step in plan if "TEMP B-TREE FOR ORDER BY" in step]
+                self.assertFalse(sorts, f"{name} sorts the whole result: {plan}")
+
+    def test_search_uses_fts_index(self):
+        searches = [sql for name, sql in self.hot_queries() if RANKED_SEARCH.search(sql)]
+        self.assertTrue(searches)
+        for sql in searches:
+            plan = self.plan(sql)
+            self.assertTrue(any(re.match(r"SCAN case_search VIRTUAL TABLE INDEX \d+:M", step) for step in plan),
+                            f"case search does not use the full-text index: {plan}")
+            self.assertIn("SEARCH c USING INTEGER PRIMARY KEY (rowid=?)", plan)
+
+    def test_indexes_come_from_migrations(self):
+        names = {row["name"] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+        for index in ("idx_cases_created_at", "idx_cases_missing_date",
+                      "idx_cases_embedding_version", "idx_comments_case_id",
+                      "idx_embedding_jobs_due"):
+            self.assertIn(index, names)
+        applied = {row["name"] for row in self.conn.execute("SELECT name FROM schema_migrations")}
+        self.assertIn("006_hot_query_indexes", applied)
+        self.assertIn("010_case_search", applied)
+
+
+if __name__ == "__main__":
+    unittest.main()